@@ -19,6 +19,8 @@ _homedir_ = os.path.expanduser('~')
 _confdir_ = os.path.join(_homedir_, '.litmus')
 _duts_ = os.path.join(_confdir_, 'topology')
 _projects_ = os.path.join(_confdir_, 'projects')
+_imagecachedir_ = os.path.join(_confdir_, 'imagecache')
+_powersettle_ = os.path.join(_confdir_, 'powersettle.json')
 _tmpdir_ = '/tmp'
 _path_for_locks_ = '/var/lock/litmus/'
 _dev_types_ = ('u3', 'xu3', 'artik5', 'artik10',
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# Copyright 2015-2016 Samsung Electronics Co., Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import hashlib
+import logging
+import tarfile
+import tempfile
+import fasteners
+from litmus import _imagecachedir_
+from litmus.core.util import convert_single_item_to_list
+
+
+class imagecache(object):
+    """
+    Content-addressed cache of extracted flash images.
+
+    Archives are keyed by the sha1 of their contents and extracted only once.
+    Extracted images are shared between devices and jobs by hardlinking them
+    into the working directory. Least recently used entries are evicted when
+    the cache grows beyond max_size.
+    """
+
+    _cachedir = _imagecachedir_
+    _max_size = 20 * 1024 * 1024 * 1024
+    _chunk_size = 1024 * 1024
+
+    def __init__(self, cachedir=None, max_size=None):
+        """
+        :param str cachedir: cache directory path
+        :param int max_size: max size of cache in bytes
+        """
+        super(imagecache, self).__init__()
+        if cachedir:
+            self._cachedir = cachedir
+        if max_size is not None:
+            self._max_size = max_size
+        os.makedirs(self._cachedir, exist_ok=True)
+        self._lock = fasteners.InterProcessLock(os.path.join(self._cachedir,
+                                                             '.lock'))
+
+    def extract(self, filenames, dest=os.curdir):
+        """
+        Extract archives through the cache and link images into dest.
+
+        Items of filenames can also be background_download instances from
+        litmus.helper.helper. Those are extracted while they are still
+        being downloaded.
+
+        :param list filenames: archive filename string or list
+        :param str dest: directory to link extracted images into
+
+        Example:
+            >>> cache = imagecache()
+            >>> cache.extract('tizen-wearable_20170718.1_circle.tar.gz')
+            ['zImage', 'rootfs.img', 'user.img', 'system-data.img']
+
+        :returns list: names of images linked into dest
+        """
+        images = []
+        for l in convert_single_item_to_list(filenames):
+            if isinstance(l, str):
+                images.extend(self._extract_one(l, dest))
+            else:
+                images.extend(self._extract_download(l, dest))
+        self.evict()
+        logging.debug('images from cache : {}'.format(images))
+        return images
+
+    def evict(self):
+        """
+        Remove least recently used entries until cache fits in max_size.
+        """
+        with self._lock:
+            entries = []
+            for name in os.listdir(self._cachedir):
+                path = os.path.join(self._cachedir, name)
+                if os.path.isdir(path) and not name.endswith('.tmp'):
+                    entries.append((os.stat(path).st_mtime,
+                                    self._du(path), path))
+            total = sum(e[1] for e in entries)
+            for mtime, size, path in sorted(entries):
+                if total <= self._max_size:
+                    break
+                logging.debug('evict {} from image cache'.format(path))
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
+
+    def _extract_one(self, filename, dest):
+        """docstring for _extract_one"""
+        digest = self._digest(filename)
+        entry = os.path.join(self._cachedir, digest)
+        with self._lock:
+            if os.path.isdir(entry):
+                logging.debug('image cache hit : {}'.format(filename))
+                return self._link_entry(entry, dest)
+        logging.debug('image cache miss : {}'.format(filename))
+        # extract without the lock so that other jobs are not blocked
+        tmp = tempfile.mkdtemp(suffix='.tmp', dir=self._cachedir)
+        with open(filename, 'rb') as f:
+            self._untar(f, tmp)
+        return self._publish(tmp, entry, dest)
+
+    def _extract_download(self, download, dest):
+        """docstring for _extract_download"""
+        logging.debug('extract {} while downloading'.format(download))
+        # the digest is known only after the whole archive has arrived.
+        # extract into a private directory and publish it afterwards.
+        tmp = tempfile.mkdtemp(suffix='.tmp', dir=self._cachedir)
+        f = download.open()
+        try:
+            h = hashlib.sha1()
+            self._untar(_hashing_reader(f, h), tmp)
+            for chunk in iter(lambda: f.read(self._chunk_size), b''):
+                h.update(chunk)
+            download.wait()
+        except Exception:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        finally:
+            f.close()
+        entry = os.path.join(self._cachedir, h.hexdigest())
+        return self._publish(tmp, entry, dest)
+
+    def _publish(self, tmp, entry, dest):
+        """docstring for _publish"""
+        with self._lock:
+            if os.path.isdir(entry):
+                # another job has extracted the same archive meanwhile
+                shutil.rmtree(tmp, ignore_errors=True)
+            else:
+                # mkdtemp creates a private directory. share it.
+                os.chmod(tmp, 0o755)
+                os.rename(tmp, entry)
+            return self._link_entry(entry, dest)
+
+    def _link_entry(self, entry, dest):
+        """docstring for _link_entry"""
+        # mtime of an entry is used as its last access time
+        os.utime(entry)
+        # callers hold the lock so that eviction from other processes
+        # can't remove the entry in the middle of linking.
+        names = sorted(os.listdir(entry))
+        for name in names:
+            self._link(os.path.join(entry, name), os.path.join(dest, name))
+        return names
+
+    def _untar(self, fileobj, path):
+        """docstring for _untar"""
+        os.makedirs(path, exist_ok=True)
+        try:
+            with tarfile.open(fileobj=fileobj, mode='r|*') as tar:
+                for member in tar:
+                    if not member.isfile():
+                        continue
+                    name = os.path.basename(member.name)
+                    src = tar.extractfile(member)
+                    with open(os.path.join(path, name), 'wb') as f:
+                        shutil.copyfileobj(src, f, self._chunk_size)
+                    # images are shared by hardlinks. keep them read-only.
+                    os.chmod(os.path.join(path, name), 0o444)
+        except Exception:
+            shutil.rmtree(path, ignore_errors=True)
+            raise
+
+    def _digest(self, filename):
+        """docstring for _digest"""
+        h = hashlib.sha1()
+        with open(filename, 'rb') as f:
+            for chunk in iter(lambda: f.read(self._chunk_size), b''):
+                h.update(chunk)
+        return h.hexdigest()
+
+    def _link(self, src, dest):
+        """docstring for _link"""
+        if os.path.lexists(dest):
+            os.remove(dest)
+        try:
+            os.link(src, dest)
+        except OSError:
+            shutil.copyfile(src, dest)
+
+    def _du(self, path):
+        """docstring for _du"""
+        return sum(os.path.getsize(os.path.join(path, f))
+                   for f in os.listdir(path))
+
+
+class _hashing_reader(object):
+    """docstring for _hashing_reader"""
+
+    def __init__(self, fileobj, h):
+        self._fileobj = fileobj
+        self._h = h
+
+    def read(self, size=-1):
+        """docstring for read"""
+        data = self._fileobj.read(size)
+        self._h.update(data)
+        return data
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# Copyright 2015-2016 Samsung Electronics Co., Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+import json
+import logging
+from array import array
+from itertools import count
+from bisect import bisect_left, bisect_right
+from threading import Thread, Event, Lock
+
+
+class powersampler(object):
+    """
+    Sample power telemetry in a background thread.
+
+    Samples are kept in array-backed time series (timestamp, voltage,
+    current, power). Labeled marks split the series into segments such as
+    testcases, and summary() returns mean, peak and energy of each.
+    """
+
+    def __init__(self, read_func, rate=10):
+        """
+        :param func read_func: function which returns a dict with \
+                'voltage', 'current' and 'power' keys
+        :param float rate: samples per second
+        """
+        super(powersampler, self).__init__()
+        self._read_func = read_func
+        self._interval = 1.0 / rate
+        self._lock = Lock()
+        self._stop_event = Event()
+        self._thread = None
+        self._t0 = None
+        self.timestamps = array('d')
+        self.voltages = array('d')
+        self.currents = array('d')
+        self.powers = array('d')
+        self.marks = []
+        self._keys = count()
+
+    def start(self):
+        """
+        Start sampling.
+        """
+        self._t0 = time.perf_counter()
+        self._stop_event.clear()
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop sampling.
+        """
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def mark(self, label, begin=True, key=None):
+        """
+        Mark the beginning or the end of a labeled segment.
+
+        Segments with the same label may overlap (e.g. a test which runs
+        twice in parallel). The key returned for the beginning tells which
+        segment an end mark closes.
+
+        :param str label: segment label (e.g. testcase name)
+        :param bool begin: True for the beginning, False for the end
+        :param key: key returned by the beginning mark. If None, the end \
+                mark closes the latest open segment of label.
+
+        Example:
+            >>> key = sampler.mark('verify_dmesg')
+            >>> sampler.mark('verify_dmesg', begin=False, key=key)
+
+        :returns int: key of the segment
+        """
+        with self._lock:
+            if begin and key is None:
+                key = next(self._keys)
+            self.marks.append((time.perf_counter() - self._t0, label, begin,
+                               key))
+        return key
+
+    def summary(self):
+        """
+        Return statistics of the whole series and of each labeled segment.
+
+        Example:
+            >>> sampler.summary()
+            {'total': {'duration': 12.1, 'samples': 121,
+                       'mean_power': 2.13, 'peak_power': 3.52,
+                       'energy': 25.8},
+             'segments': [{'label': 'verify_dmesg', 'duration': 1.2, ...}]}
+
+        :returns dict: duration(s), mean_power(W), peak_power(W), energy(J)
+        """
+        with self._lock:
+            result = {'total': self._stats(0, len(self.timestamps)),
+                      'segments': []}
+            opened = {}
+            for t, label, begin, key in self.marks:
+                if begin:
+                    opened[key] = (t, label)
+                    continue
+                if key is None:
+                    key = next((k for k in reversed(list(opened))
+                                if opened[k][1] == label), None)
+                if key in opened:
+                    lo = bisect_left(self.timestamps, opened.pop(key)[0])
+                    hi = bisect_right(self.timestamps, t)
+                    stats = self._stats(lo, hi)
+                    stats['label'] = label
+                    result['segments'].append(stats)
+        return result
+
+    def segment(self, key):
+        """
+        Return statistics of the segment of key.
+
+        :param key: key returned by mark()
+
+        Example:
+            >>> key = sampler.mark('verify_dmesg')
+            >>> sampler.mark('verify_dmesg', begin=False, key=key)
+            >>> sampler.segment(key)
+            {'label': 'verify_dmesg', 'duration': 1.2, 'samples': 12,
+             'mean_power': 2.1, 'peak_power': 3.5, 'energy': 2.6}
+
+        :returns dict: statistics or None if the segment isn't closed
+        """
+        with self._lock:
+            times = dict((begin, (t, label)) for t, label, begin, k
+                         in self.marks if k == key)
+            if True not in times or False not in times:
+                return None
+            lo = bisect_left(self.timestamps, times[True][0])
+            hi = bisect_right(self.timestamps, times[False][0])
+            stats = self._stats(lo, hi)
+            stats['label'] = times[True][1]
+        return stats
+
+    def save(self, filename):
+        """
+        Save summary and samples as a json file.
+
+        :param str filename: json file name
+        """
+        data = self.summary()
+        with self._lock:
+            data['samples'] = {'timestamp': self.timestamps.tolist(),
+                               'voltage': self.voltages.tolist(),
+                               'current': self.currents.tolist(),
+                               'power': self.powers.tolist()}
+        with open(filename, 'w') as f:
+            json.dump(data, f)
+
+    def _stats(self, lo, hi):
+        """docstring for _stats"""
+        ts = self.timestamps[lo:hi]
+        ps = self.powers[lo:hi]
+        if not ts:
+            return {'duration': 0.0, 'samples': 0, 'mean_power': 0.0,
+                    'peak_power': 0.0, 'energy': 0.0}
+        # trapezoidal integration of power over time
+        energy = sum((ts[i] - ts[i-1]) * (ps[i] + ps[i-1]) / 2
+                     for i in range(1, len(ts)))
+        return {'duration': ts[-1] - ts[0],
+                'samples': len(ts),
+                'mean_power': sum(ps) / len(ps),
+                'peak_power': max(ps),
+                'energy': energy}
+
+    def _run(self):
+        """docstring for _run"""
+        next_time = time.perf_counter()
+        while not self._stop_event.is_set():
+            try:
+                values = self._read_func()
+            except Exception as e:
+                logging.debug(e)
+                values = None
+            if values:
+                with self._lock:
+                    self.timestamps.append(time.perf_counter() - self._t0)
+                    self.voltages.append(values['voltage'])
+                    self.currents.append(values['current'])
+                    self.powers.append(values['power'])
+            next_time += self._interval
+            self._stop_event.wait(max(0, next_time - time.perf_counter()))
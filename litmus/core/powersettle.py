@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# Copyright 2015-2016 Samsung Electronics Co., Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import json
+import logging
+import fasteners
+from litmus import _powersettle_
+
+
+class powersettle(object):
+    """
+    Power-settle delays learned per device.
+
+    Measured settle times (e.g. how long a board takes to go dead after
+    its power is cut) are stored per device and per key. Once enough
+    samples are recorded, the delay is the largest recent sample with a
+    safety margin, bounded by a maximum. The default delay is used until
+    then.
+    """
+
+    _max_samples = 20
+    _min_samples = 3
+    _margin = 1.5
+    _min_delay = 0.2
+
+    def __init__(self, name, path=None):
+        """
+        :param str name: device name
+        :param str path: json file which keeps samples of all devices
+        """
+        super(powersettle, self).__init__()
+        self._name = name
+        self._path = path or _powersettle_
+        self._ilock = fasteners.InterProcessLock(self._path + '.lock')
+        self._samples = None
+
+    def get(self, key, default, maximum=None):
+        """
+        Return the tuned delay.
+
+        :param str key: kind of delay (e.g. 'off')
+        :param float default: delay used until enough samples are recorded
+        :param float maximum: upper bound of the tuned delay. \
+                If None, default is the upper bound.
+
+        Example:
+            >>> settle = powersettle('XU3_001')
+            >>> settle.get('off', 1, maximum=4)
+            0.42
+
+        :returns float: delay in seconds
+        """
+        samples = self._load().get(key, [])
+        if len(samples) < self._min_samples:
+            return default
+        return min(maximum or default,
+                   max(self._min_delay, max(samples) * self._margin))
+
+    def record(self, key, seconds):
+        """
+        Record a measured settle time.
+
+        :param str key: kind of delay (e.g. 'off')
+        :param float seconds: measured settle time
+        """
+        self._update(key, lambda samples:
+                     (samples + [round(seconds, 3)])[-self._max_samples:])
+
+    def reset(self, key):
+        """
+        Forget samples so that the default delay is used again.
+
+        :param str key: kind of delay (e.g. 'off')
+        """
+        self._update(key, lambda samples: [])
+
+    def _load(self):
+        """docstring for _load"""
+        if self._samples is None:
+            self._samples = self._read().get(self._name, {})
+        return self._samples
+
+    def _read(self):
+        """docstring for _read"""
+        try:
+            with open(self._path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _update(self, key, func):
+        """docstring for _update"""
+        try:
+            os.makedirs(os.path.dirname(self._path), exist_ok=True)
+            with self._ilock:
+                data = self._read()
+                samples = data.setdefault(self._name, {})
+                samples[key] = func(samples.get(key, []))
+                tmp = self._path + '.tmp'
+                with open(tmp, 'w') as f:
+                    json.dump(data, f, indent=1, sort_keys=True)
+                os.replace(tmp, self._path)
+            self._samples = samples
+        except OSError as e:
+            logging.debug('Can\'t save power-settle delays : {}'.format(e))
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# Copyright 2015-2016 Samsung Electronics Co., Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import time
+import json
+from threading import Lock
+from xml.sax.saxutils import quoteattr, escape
+
+
+class resultwriter(object):
+    """
+    Write testcase results as soon as each testcase finishes.
+
+    Each result is appended to a JSONL file and to a JUnit XML file.
+    The XML file is kept well-formed after every testcase so that partial
+    results survive a crash and CI can show progress. If another writer
+    of this process has the same files open (e.g. the same test runs
+    twice in parallel), a suffix such as _2 is added to the file name.
+
+    Example:
+        >>> from litmus.core.resultwriter import resultwriter
+        >>> with resultwriter('result', 'testresult_dmesg',
+                              'verify_dmesg') as writer:
+                writer.add('panel_is_alive', True)
+        >>> # result/testresult_dmesg.xml, result/testresult_dmesg.jsonl
+    """
+
+    _xml_header = '<?xml version="1.0" encoding="UTF-8"?>\n'
+    _xml_footer = '</testsuite>\n'
+
+    # paths of writers which are open in this process
+    _open_paths = set()
+    _paths_lock = Lock()
+
+    def __init__(self, result_dir, filename, suite_name):
+        """
+        :param str result_dir: directory to save results
+        :param str filename: file name without extension
+        :param str suite_name: test suite name
+        """
+        super(resultwriter, self).__init__()
+        self._suite_name = suite_name
+        self._lock = Lock()
+        self._last_time = time.perf_counter()
+        path = self._reserve(os.path.join(os.path.abspath(result_dir),
+                                          filename))
+        self.path = path
+        self._jsonl = open(path + '.jsonl', 'w')
+        self._xml = open(path + '.xml', 'w')
+        self._xml.write(self._xml_header)
+        self._xml.write('<testsuite name={}>\n'.format(quoteattr(suite_name)))
+        self._write_xml('')
+        self.failures = 0
+        self.tests = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def add(self, name, passed, duration=None, message=None,
+            properties=None):
+        """
+        Add a testcase result.
+
+        :param str name: testcase name
+        :param bool passed: True if the testcase passed
+        :param float duration: seconds. If None, the time since the \
+                previous result is used.
+        :param str message: failure message
+        :param dict properties: extra values of the testcase \
+                (e.g. power consumption)
+        """
+        with self._lock:
+            now = time.perf_counter()
+            if duration is None:
+                duration = now - self._last_time
+            self._last_time = now
+            self.tests += 1
+            if not passed:
+                self.failures += 1
+
+            self._jsonl.write(json.dumps({'suite': self._suite_name,
+                                          'name': name,
+                                          'passed': bool(passed),
+                                          'time': round(duration, 3),
+                                          'message': message,
+                                          'properties': properties})
+                              + '\n')
+            self._jsonl.flush()
+
+            testcase = '  <testcase classname={0} name={1} time="{2:.3f}"' \
+                .format(quoteattr(self._suite_name), quoteattr(name),
+                        duration)
+            children = ''
+            if properties:
+                children += '    <properties>\n'
+                for key in sorted(properties):
+                    children += ('      <property name={0} value={1}/>\n'
+                                 .format(quoteattr(key),
+                                         quoteattr(str(properties[key]))))
+                children += '    </properties>\n'
+            if not passed:
+                children += ('    <failure message={0}>{1}</failure>\n'
+                             .format(quoteattr(message or 'failed'),
+                                     escape(message or '')))
+            if children:
+                testcase += '>\n' + children + '  </testcase>\n'
+            else:
+                testcase += '/>\n'
+            self._write_xml(testcase)
+
+    def close(self):
+        """
+        Close result files.
+        """
+        with self._lock:
+            if self._xml.closed:
+                return
+            self._xml.close()
+            self._jsonl.close()
+        with self._paths_lock:
+            self._open_paths.discard(self.path)
+
+    def _reserve(self, path):
+        """docstring for _reserve"""
+        # runs of the same test in parallel get their own files
+        with self._paths_lock:
+            candidate = path
+            index = 2
+            while candidate in self._open_paths:
+                candidate = '{0}_{1}'.format(path, index)
+                index += 1
+            self._open_paths.add(candidate)
+        return candidate
+
+    def _write_xml(self, testcase):
+        """docstring for _write_xml"""
+        # overwrite the footer with a new testcase and write it again
+        if testcase:
+            self._xml.seek(self._footer_pos)
+        self._xml.write(testcase)
+        self._footer_pos = self._xml.tell()
+        self._xml.write(self._xml_footer)
+        self._xml.flush()
@@ -18,7 +18,10 @@ import re
 import sys
 import logging
 import yaml
+import signal
 import subprocess
+from threading import local, Lock
+from concurrent.futures import ThreadPoolExecutor
 from distutils.dir_util import copy_tree
 from distutils.file_util import copy_file
 
@@ -85,8 +88,11 @@ def check_output(cmd, timeout=None, encoding='ISO-8859-1', shell=False,
     """
     outs = None
     try:
-        outs = subprocess.check_output(cmd, timeout=timeout, shell=shell,
-                                       stderr=stderr)
+        ret, output = _run(cmd, timeout=timeout, shell=shell,
+                           stdout=subprocess.PIPE, stderr=stderr)
+        if ret:
+            raise subprocess.CalledProcessError(ret, cmd, output=output)
+        outs = output
         if outs:
             outs = decode(outs, encoding=encoding)
     except subprocess.TimeoutExpired as e:
@@ -116,8 +122,8 @@ def call(cmd, timeout=None, shell=False,
     """
     ret = None
     try:
-        ret = subprocess.call(cmd, timeout=timeout, shell=shell,
-                              stdout=stdout, stderr=stderr)
+        ret, _ = _run(cmd, timeout=timeout, shell=shell,
+                      stdout=stdout, stderr=stderr)
     except subprocess.TimeoutExpired:
         logging.debug('command {} timed out'.format(cmd))
         exc = sys.exc_info()
@@ -129,6 +135,145 @@ def call(cmd, timeout=None, shell=False,
     return ret
 
 
+def popen(cmd, **kwargs):
+    """
+    Start a subprocess.
+    This is a wrapper of subprocess.Popen(). The subprocess is started in
+    a new session so that it can be killed with all of its children, and
+    it is killed when the watchdog of the test which started it expires.
+
+    Example:
+        >>> proc = litmus.core.util.popen(['sdb', 'shell'],
+                                          stdin=subprocess.PIPE)
+    """
+    kwargs.setdefault('start_new_session', True)
+    proc = subprocess.Popen(cmd, **kwargs)
+    watch = getattr(_watches, 'current', None)
+    if watch:
+        watch.add(proc)
+    return proc
+
+
+def kill_process_group(proc):
+    """
+    Kill a subprocess started by popen() and all of its children.
+
+    :param Popen proc: subprocess
+    """
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except OSError:
+        # the group is gone or the process has its own group
+        try:
+            proc.kill()
+        except OSError:
+            pass
+
+
+def _run(cmd, timeout=None, shell=False, stdout=None, stderr=None):
+    """docstring for _run"""
+    with popen(cmd, shell=shell, stdout=stdout, stderr=stderr) as proc:
+        try:
+            outs, errs = proc.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            kill_process_group(proc)
+            try:
+                outs, errs = proc.communicate(timeout=_kill_grace)
+            except subprocess.TimeoutExpired:
+                # a child which left the group still holds the pipe
+                outs = None
+                proc.wait()
+            raise subprocess.TimeoutExpired(cmd, timeout, output=outs)
+        except BaseException:
+            kill_process_group(proc)
+            raise
+        finally:
+            watch = getattr(_watches, 'current', None)
+            if watch:
+                watch.discard(proc)
+    return proc.returncode, outs
+
+
+_kill_grace = 1
+_watches = local()
+
+
+class process_watch(object):
+    """
+    Collect subprocesses started in a thread so that they can be killed.
+
+    Example:
+        >>> watch = process_watch()
+        >>> with watch:
+                dut.run_cmd('sleep 100')
+        >>> # in another thread
+        >>> watch.kill()
+    """
+
+    def __init__(self):
+        super(process_watch, self).__init__()
+        self._procs = set()
+        self._lock = Lock()
+        self.killed = False
+
+    def __enter__(self):
+        _watches.current = self
+        return self
+
+    def __exit__(self, *args):
+        _watches.current = None
+
+    def add(self, proc):
+        """docstring for add"""
+        with self._lock:
+            if self.killed:
+                kill_process_group(proc)
+            self._procs.add(proc)
+
+    def discard(self, proc):
+        """docstring for discard"""
+        with self._lock:
+            self._procs.discard(proc)
+
+    def kill(self):
+        """
+        Kill all running subprocesses of the thread.
+        Subprocesses started after this are killed immediately.
+        """
+        with self._lock:
+            self.killed = True
+            for l in self._procs:
+                kill_process_group(l)
+
+
+class watched_executor(ThreadPoolExecutor):
+    """
+    ThreadPoolExecutor which runs tasks under the process_watch of the
+    submitting thread, so that the watchdog of a test also kills
+    subprocesses started by its worker threads.
+
+    Example:
+        >>> with watched_executor(max_workers=4) as executor:
+                executor.map(dut.run_cmd, cmds)
+    """
+
+    def submit(self, fn, *args, **kwargs):
+        watch = getattr(_watches, 'current', None)
+        if watch is None:
+            return super(watched_executor, self).submit(fn, *args, **kwargs)
+
+        def _watched():
+            """docstring for _watched"""
+            previous = getattr(_watches, 'current', None)
+            _watches.current = watch
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _watches.current = previous
+
+        return super(watched_executor, self).submit(_watched)
+
+
 def convert_single_item_to_list(item):
     """
     Convert a item to list and return it.
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# Copyright 2015-2016 Samsung Electronics Co., Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import mmap
+import struct
+from PIL import Image
+
+_header_fields = ('header_size', 'file_version', 'pixmap_format',
+                  'pixmap_depth', 'pixmap_width', 'pixmap_height',
+                  'xoffset', 'byte_order', 'bitmap_unit', 'bitmap_bit_order',
+                  'bitmap_pad', 'bits_per_pixel', 'bytes_per_line',
+                  'visual_class', 'red_mask', 'green_mask', 'blue_mask',
+                  'bits_per_rgb', 'colormap_entries', 'ncolors',
+                  'window_width', 'window_height', 'window_x', 'window_y',
+                  'window_bdrwidth')
+_header_format = '>{}I'.format(len(_header_fields))
+_color_format = '>IHHHBB'
+_zpixmap = 2
+_lsbfirst = 0
+
+
+def parse_header(data):
+    """
+    Parse a XWD file header.
+
+    :param bytes data: XWD file data
+
+    :returns dict: header fields
+    """
+    header = dict(zip(_header_fields,
+                      struct.unpack_from(_header_format, data)))
+    if header['file_version'] != 7:
+        raise Exception('Unsupported XWD version : {}'
+                        .format(header['file_version']))
+    if header['pixmap_format'] != _zpixmap:
+        raise Exception('Unsupported XWD pixmap format : {}'
+                        .format(header['pixmap_format']))
+    return header
+
+
+def _truecolor_rawmode(header):
+    """docstring for _truecolor_rawmode"""
+    nbytes = header['bits_per_pixel'] // 8
+    channels = ['X'] * nbytes
+    for name, key in (('R', 'red_mask'), ('G', 'green_mask'),
+                      ('B', 'blue_mask')):
+        mask = header[key]
+        shift = (mask & -mask).bit_length() - 1
+        if mask >> shift != 0xff or shift % 8:
+            raise Exception('Unsupported XWD color mask : {:#x}'.format(mask))
+        channels[shift // 8] = name
+    # channels are ordered from the least significant byte
+    if header['byte_order'] != _lsbfirst:
+        channels.reverse()
+    return ''.join(channels)
+
+
+def decode(data):
+    """
+    Decode XWD data to an image.
+
+    ZPixmap images with 24/32 bits TrueColor pixels and 8 bits
+    PseudoColor pixels are supported.
+
+    :param bytes data: XWD file data (bytes or mmap)
+
+    :returns Image: decoded image
+    """
+    header = parse_header(data)
+    width = header['pixmap_width']
+    height = header['pixmap_height']
+    stride = header['bytes_per_line']
+    colors_offset = header['header_size']
+    colors_size = header['ncolors'] * struct.calcsize(_color_format)
+    offset = colors_offset + colors_size
+    pixels = data[offset:offset + stride * height]
+
+    bpp = header['bits_per_pixel']
+    if bpp in (24, 32):
+        rawmode = _truecolor_rawmode(header)
+        return Image.frombytes('RGB', (width, height), pixels,
+                               'raw', rawmode, stride, 1)
+    elif bpp == 8:
+        palette = [0] * 768
+        for idx in range(header['ncolors']):
+            pixel, r, g, b, flags, pad = struct.unpack_from(
+                _color_format, data,
+                colors_offset + idx * struct.calcsize(_color_format))
+            if pixel < 256:
+                palette[pixel * 3:pixel * 3 + 3] = [r >> 8, g >> 8, b >> 8]
+        im = Image.frombytes('P', (width, height), pixels,
+                             'raw', 'P', stride, 1)
+        im.putpalette(palette)
+        return im.convert('RGB')
+    else:
+        raise Exception('Unsupported XWD bits per pixel : {}'.format(bpp))
+
+
+def load(filename):
+    """
+    Load a XWD file through a memory mapping.
+
+    Example:
+        >>> from litmus.core.xwd import load
+        >>> load('screen.xwd').save('screen.png')
+
+    :param str filename: XWD file path
+
+    :returns Image: decoded image
+    """
+    with open(filename, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            return decode(m)
@@ -57,3 +57,32 @@ class cutter(object):
         """
         Return whether cutter is turned on or not.
         """
+
+    def read_power(self):
+        """
+        Return voltage(V), current(A) and power(W) of the cutter output.
+        Cutters which can't measure power return None.
+        """
+        return None
+
+    def get_switch(self):
+        """
+        Return an identifier of the physical switch of the cutter.
+        Cutters which have the same identifier share one switch.
+        """
+        return (self._ctype, self._cport)
+
+    @classmethod
+    def set_switch(cls, cutters, on_off):
+        """
+        Turn on or off cutters which share one physical switch.
+        Cutters which can control several channels at once override this.
+
+        :param list cutters: cutter instances of the same switch
+        :param bool on_off: True to turn on, False to turn off
+
+        :returns bool: True if all cutters are switched
+        """
+        results = [l.on(delay=0) if on_off else l.off(delay=0)
+                   for l in cutters]
+        return all(results)
@@ -13,18 +13,31 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
+import time
+import fasteners
+from threading import Lock
 from litmus.device.cutter import cutter
 from litmus.core.util import call, check_output, find_pattern
-import time
+from litmus import _path_for_locks_
 
 
 class cuttercleware4(cutter):
-    """docstring for cuttercleware4"""
+    """
+    Cutter for Cleware 4-port USB switch.
+
+    Each instance controls one channel. Channels of a switch can be set
+    together with set_switch() in a single clewarecontrol command.
+    Accesses to a switch are serialized between threads and processes.
+    """
 
     _cindex = None
     _cmd = 'clewarecontrol -d {cport} -c 1'
-    _controlcmd = _cmd + ' -as {cindex} {on_off}'
     _getstatuscmd = _cmd + ' -rs {cindex}'
+    _actioncmd = ' -as {cindex} {on_off}'
+
+    _switch_locks = {}
+    _switch_locks_guard = Lock()
 
     def __init__(self, *args, **kwargs):
         super(cuttercleware4, self).__init__(*args, **kwargs)
@@ -33,21 +46,14 @@ class cuttercleware4(cutter):
     def on(self, delay=1):
         """docstring for on"""
         super(cuttercleware4, self).on()
-
-        c = self._controlcmd.format(cport=self._cport,
-                                    cindex=self._cindex,
-                                    on_off=1)
-        out = call(c, shell=True, timeout=10)
+        out = self._set_channels(self._cport, {self._cindex: 1})
         time.sleep(delay)
         return not out
 
     def off(self, delay=4):
         """docstring for off"""
         super(cuttercleware4, self).off()
-        c = self._controlcmd.format(cport=self._cport,
-                                    cindex=self._cindex,
-                                    on_off=0)
-        out = call(c, shell=True, timeout=10)
+        out = self._set_channels(self._cport, {self._cindex: 0})
         time.sleep(delay)
         return not out
 
@@ -55,9 +61,73 @@ class cuttercleware4(cutter):
         """docstring for is_on"""
         super(cuttercleware4, self).is_on()
         c = self._getstatuscmd.format(cport=self._cport, cindex=self._cindex)
-        out = check_output(c, shell=True, timeout=10)
+        with self._lock_switch(self._cport):
+            out = check_output(c, shell=True, timeout=10)
 
         if find_pattern(pattern=r'On', data=out):
             return True
         else:
             return False
+
+    @classmethod
+    def set_switch(cls, cutters, on_off):
+        """
+        Turn on or off several channels of one switch in one command.
+
+        :param list cutters: cuttercleware4 instances of the same switch
+        :param bool on_off: True to turn on, False to turn off
+
+        Example:
+            >>> cuttercleware4.set_switch(cutters, True)
+            True
+
+        :returns bool: True if all channels are switched
+        """
+        ports = set(l._cport for l in cutters)
+        if len(ports) != 1:
+            raise Exception('Can\'t set channels of different switches : {}'
+                            .format(ports))
+        channels = dict((l._cindex, int(bool(on_off))) for l in cutters)
+        return not cls._set_channels(ports.pop(), channels)
+
+    @classmethod
+    def _set_channels(cls, cport, channels):
+        """docstring for _set_channels"""
+        c = cls._cmd.format(cport=cport)
+        for cindex in sorted(channels):
+            c += cls._actioncmd.format(cindex=cindex,
+                                       on_off=channels[cindex])
+        with cls._lock_switch(cport):
+            return call(c, shell=True, timeout=10)
+
+    @classmethod
+    def _lock_switch(cls, cport):
+        """docstring for _lock_switch"""
+        with cls._switch_locks_guard:
+            if cport not in cls._switch_locks:
+                ilock_path = os.path.join(_path_for_locks_,
+                                          'cleware4_{}'.format(cport))
+                cls._switch_locks[cport] = _switch_lock(ilock_path)
+            return cls._switch_locks[cport]
+
+
+class _switch_lock(object):
+    """docstring for _switch_lock"""
+
+    def __init__(self, ilock_path):
+        super(_switch_lock, self).__init__()
+        self._tlock = Lock()
+        self._ilock = fasteners.InterProcessLock(ilock_path)
+
+    def __enter__(self):
+        self._tlock.acquire()
+        try:
+            self._ilock.acquire()
+        except Exception:
+            self._tlock.release()
+            raise
+        return self
+
+    def __exit__(self, *args):
+        self._ilock.release()
+        self._tlock.release()
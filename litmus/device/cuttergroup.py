@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# Copyright 2015-2016 Samsung Electronics Co., Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+from collections import OrderedDict
+from litmus.core.util import watched_executor
+
+
+class cuttergroup(object):
+    """
+    Control a group of cutters together.
+
+    Cutters are grouped by their physical switch. Channels of a switch
+    are set in one operation and different switches are set in parallel.
+    """
+
+    def __init__(self, cutters, max_workers=16):
+        """
+        :param list cutters: cutter instances
+        :param int max_workers: max number of switches set in parallel
+        """
+        super(cuttergroup, self).__init__()
+        self._cutters = list(cutters)
+        self._max_workers = max_workers
+
+    def on(self, delay=1):
+        """
+        Turn on all cutters of the group.
+
+        :param float delay: delay after turning on
+
+        Example:
+            >>> from litmus.device.cuttergroup import cuttergroup
+            >>> cuttergroup(cutters).on()
+            True
+
+        :returns bool: True if all cutters are turned on
+        """
+        result = self._set(True)
+        time.sleep(delay)
+        return result
+
+    def off(self, delay=1):
+        """
+        Turn off all cutters of the group.
+
+        :param float delay: delay after turning off
+
+        Example:
+            >>> from litmus.device.cuttergroup import cuttergroup
+            >>> cuttergroup(cutters).off()
+            True
+
+        :returns bool: True if all cutters are turned off
+        """
+        result = self._set(False)
+        time.sleep(delay)
+        return result
+
+    def power_cycle(self, off_delay=0.5, on_delay=0.5):
+        """
+        Turn off and turn on all cutters of the group.
+
+        :param float off_delay: delay after turning off
+        :param float on_delay: delay after turning on
+
+        :returns bool: True if all cutters are turned on again
+        """
+        self.off(off_delay)
+        return self.on(on_delay)
+
+    def _switches(self):
+        """docstring for _switches"""
+        switches = OrderedDict()
+        for l in self._cutters:
+            switches.setdefault(l.get_switch(), []).append(l)
+        return list(switches.values())
+
+    def _set(self, on_off):
+        """docstring for _set"""
+        switches = self._switches()
+        if not switches:
+            return True
+        workers = min(self._max_workers, len(switches))
+        with watched_executor(max_workers=workers) as executor:
+            results = list(executor.map(
+                lambda cutters: type(cutters[0]).set_switch(cutters, on_off),
+                switches))
+        return all(results)
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+# Copyright 2015-2016 Samsung Electronics Co., Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import re
+import time
+import queue
+import socket
+import logging
+import requests
+import urllib.parse
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
+from litmus.device.cutter import cutter
+from litmus.core.util import find_pattern, decode
+
+
+class cutterpdu(cutter):
+    """
+    Cutter for network controlled power strips (PDU).
+
+    cutter_port is the address of the PDU. http://host[:port] controls
+    outlets through HTTP requests and telnet://host[:port] through a
+    line based telnet console. pdu_outlet is the outlet number of the
+    device. Connections are pooled per PDU and shared between instances.
+
+    The protocol differs between PDU vendors, so commands are configurable
+    by topology keys. {outlet} and {state} in commands are replaced by the
+    outlet number and pdu_state_on or pdu_state_off.
+
+    - pdu_setcmd: HTTP path or telnet command to switch an outlet
+    - pdu_getcmd: HTTP path or telnet command to read outlet states
+    - pdu_pattern: regular expression to find the state of {outlet} in \
+            the output of pdu_getcmd. group 1 is the state.
+    - pdu_state_on, pdu_state_off: state strings (default: on, off)
+    - pdu_method: HTTP method of pdu_setcmd (default: GET)
+    - pdu_prompt: telnet prompt (default: '> ')
+
+    Example of topology:
+        [XU3_001]
+        dev_type = xu3
+        uart_port = /dev/ttyUSB0
+        cutter_type = pdu
+        cutter_port = http://192.168.0.100
+        pdu_outlet = 3
+        pdu_username = admin
+        pdu_password = admin
+        pdu_setcmd = /outlet?{outlet}={state}
+        pdu_getcmd = /status
+        pdu_pattern = (?mi)^\\s*outlet\\s*{outlet}\\s*[:=]?\\s*(on|off)\\b
+    """
+
+    _outlet = None
+    _auth = None
+    _timeout = 5
+    _pool_size = 8
+
+    # default commands. override them by topology keys.
+    _http_setcmd = '/outlet?{outlet}={state}'
+    _http_getcmd = '/status'
+    _http_method = 'GET'
+    _telnet_setcmd = 'outlet {outlet} {state}'
+    _telnet_getcmd = 'status'
+    _telnet_prompt = b'> '
+    _telnet_login_prompt = b'ser'
+    _telnet_password_prompt = b'assword'
+    _state_on = 'on'
+    _state_off = 'off'
+
+    _pattern_outlet = r'(?mi)^\s*outlet\s*{outlet}\s*[:=]?\s*(on|off)\b'
+
+    _http_sessions = {}
+    _telnet_pools = {}
+    _pools_lock = Lock()
+
+    def __init__(self, *args, **kwargs):
+        super(cutterpdu, self).__init__(*args, **kwargs)
+        self._outlet = int(kwargs['pdu_outlet'])
+        if kwargs.get('pdu_username'):
+            self._auth = (kwargs['pdu_username'],
+                          kwargs.get('pdu_password', ''))
+        url = urllib.parse.urlparse(self._cport)
+        if url.scheme not in ('http', 'telnet'):
+            raise Exception('Can\'t use PDU address : {}'.format(self._cport))
+        self._scheme = url.scheme
+        self._host = url.hostname
+        self._port = url.port or (80 if url.scheme == 'http' else 23)
+        if self._scheme == 'http':
+            self._setcmd = kwargs.get('pdu_setcmd', self._http_setcmd)
+            self._getcmd = kwargs.get('pdu_getcmd', self._http_getcmd)
+        else:
+            self._setcmd = kwargs.get('pdu_setcmd', self._telnet_setcmd)
+            self._getcmd = kwargs.get('pdu_getcmd', self._telnet_getcmd)
+        self._http_method = kwargs.get('pdu_method',
+                                       self._http_method).upper()
+        if 'pdu_prompt' in kwargs:
+            self._telnet_prompt = kwargs['pdu_prompt'].encode()
+        self._state_on = kwargs.get('pdu_state_on', self._state_on)
+        self._state_off = kwargs.get('pdu_state_off', self._state_off)
+        self._pattern_outlet = kwargs.get('pdu_pattern', self._pattern_outlet)
+
+    def on(self, delay=1):
+        """docstring for on"""
+        super(cutterpdu, self).on()
+        result = self._set_outlet(True)
+        time.sleep(delay)
+        return result
+
+    def off(self, delay=4):
+        """docstring for off"""
+        super(cutterpdu, self).off()
+        result = self._set_outlet(False)
+        time.sleep(delay)
+        return result
+
+    def is_on(self):
+        """docstring for is_on"""
+        super(cutterpdu, self).is_on()
+        getcmd = self._getcmd.format(outlet=self._outlet)
+        if self._scheme == 'http':
+            out = self._http_request(getcmd)
+        else:
+            out = self._telnet_command(getcmd)
+        pattern = self._pattern_outlet.replace('{outlet}', str(self._outlet))
+        state = find_pattern(pattern, out, groupindex=1)
+        return bool(state) and state.lower() == self._state_on.lower()
+
+    @classmethod
+    def set_switch(cls, cutters, on_off):
+        """
+        Turn on or off several outlets of one PDU concurrently.
+
+        :param list cutters: cutterpdu instances of the same PDU
+        :param bool on_off: True to turn on, False to turn off
+
+        :returns bool: True if all outlets are switched
+        """
+        workers = min(cls._pool_size, len(cutters))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(lambda l: l._set_outlet(on_off),
+                                        cutters))
+        return all(results)
+
+    def _set_outlet(self, on_off):
+        """docstring for _set_outlet"""
+        state = self._state_on if on_off else self._state_off
+        setcmd = self._setcmd.format(outlet=self._outlet, state=state)
+        try:
+            if self._scheme == 'http':
+                self._http_request(setcmd, method=self._http_method)
+            else:
+                self._telnet_command(setcmd)
+            return True
+        except (requests.exceptions.RequestException, OSError) as e:
+            logging.debug('Can\'t set outlet {0} of {1} : {2}'
+                          .format(self._outlet, self._cport, e))
+            return False
+
+    def _http_request(self, path, method='GET'):
+        """docstring for _http_request"""
+        base = '{0}://{1}:{2}'.format(self._scheme, self._host, self._port)
+        with self._pools_lock:
+            session = self._http_sessions.get(base)
+            if session is None:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(
+                    pool_connections=1, pool_maxsize=self._pool_size)
+                session.mount(base, adapter)
+                self._http_sessions[base] = session
+        resp = session.request(method, base + path, auth=self._auth,
+                               timeout=self._timeout)
+        resp.raise_for_status()
+        return resp.text
+
+    def _telnet_command(self, command):
+        """docstring for _telnet_command"""
+        key = (self._host, self._port)
+        with self._pools_lock:
+            pool = self._telnet_pools.get(key)
+            if pool is None:
+                pool = queue.LifoQueue(maxsize=self._pool_size)
+                self._telnet_pools[key] = pool
+        try:
+            conn = pool.get_nowait()
+        except queue.Empty:
+            conn = None
+        try:
+            return self._telnet_send(pool, conn, command)
+        except OSError as e:
+            if conn is None:
+                raise
+            # pooled connection may be closed by PDU. retry once.
+            logging.debug('Reconnect to {0} : {1}'.format(self._cport, e))
+            return self._telnet_send(pool, None, command)
+
+    def _telnet_send(self, pool, conn, command):
+        """docstring for _telnet_send"""
+        if conn is None:
+            conn = self._telnet_connect()
+        try:
+            conn.sendall(command.encode() + b'\r\n')
+            out = self._telnet_read_until(conn, self._telnet_prompt)
+        except OSError:
+            conn.close()
+            raise
+        try:
+            pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+        # drop the echoed command and the prompt
+        lines = decode(out).rsplit(decode(self._telnet_prompt), 1)[0] \
+            .split('\n')
+        if command in lines[0]:
+            lines = lines[1:]
+        return '\n'.join(lines)
+
+    def _telnet_connect(self):
+        """docstring for _telnet_connect"""
+        conn = socket.create_connection((self._host, self._port),
+                                        timeout=self._timeout)
+        try:
+            if self._auth:
+                self._telnet_read_until(conn, self._telnet_login_prompt)
+                conn.sendall(self._auth[0].encode() + b'\r\n')
+                self._telnet_read_until(conn, self._telnet_password_prompt)
+                conn.sendall(self._auth[1].encode() + b'\r\n')
+            self._telnet_read_until(conn, self._telnet_prompt)
+        except OSError:
+            conn.close()
+            raise
+        return conn
+
+    def _telnet_read_until(self, conn, expected):
+        """docstring for _telnet_read_until"""
+        buf = b''
+        while expected not in buf:
+            data = conn.recv(4096)
+            if not data:
+                raise OSError('PDU closed the connection')
+            # strip telnet option negotiations (IAC sequences)
+            buf += re.sub(b'\xff[\xfb-\xfe].|\xff[\xf0-\xfa]', b'', data)
+        return buf
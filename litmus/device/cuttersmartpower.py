@@ -13,23 +13,47 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
 import time
+import select
 import logging
 import subprocess
+from threading import Lock
 from litmus.device.cutter import cutter
-from litmus.core.util import call, check_output, find_pattern
+from litmus.core.util import call, check_output, find_pattern, decode
 
 
 class cuttersmartpower(cutter):
-    """docstring for cuttersmartpower"""
+    """
+    Cutter for Odroid SmartPower.
+
+    SmartPower is controlled through its hidraw device directly. The
+    handle is opened once and kept for the lifetime of the instance.
+    If hidraw can't be opened, smartpower command is used instead.
+    """
 
     _cmd = 'smartpower -d {cport}'
     _controlcmd = _cmd + ' -p'
     _getstatuscmd = _cmd + ' -s 5'
     _max_retry_cnt = 50
 
+    # hid requests of SmartPower firmware
+    _request_data = 0x37
+    _request_onoff = 0x82
+    _report_size = 64
+    _hid_timeout = 1.0
+    _hid_settle = 0.1
+    _pattern_power = r'[0-9].[0-9]{3}W'
+
     def __init__(self, *args, **kwargs):
         super(cuttersmartpower, self).__init__(*args, **kwargs)
+        self._hid = None
+        self._hid_lock = Lock()
+        self._open_hid()
+
+    def __del__(self):
+        """docstring for __del__"""
+        self._close_hid()
 
     def on(self, delay=1):
         """docstring for on"""
@@ -39,8 +63,7 @@ class cuttersmartpower(cutter):
         while retry_cnt < self._max_retry_cnt:
 
             if not self.is_on():
-                c = self._controlcmd.format(cport=self._cport)
-                call(c, shell=True, stderr=subprocess.DEVNULL, timeout=10)
+                self._toggle()
 
             if self.is_on():
                 time.sleep(delay)
@@ -61,8 +84,7 @@ class cuttersmartpower(cutter):
         while retry_cnt < self._max_retry_cnt:
 
             if self.is_on():
-                c = self._controlcmd.format(cport=self._cport)
-                call(c, shell=True, stderr=subprocess.DEVNULL, timeout=10)
+                self._toggle()
 
             if not self.is_on():
                 time.sleep(delay)
@@ -78,11 +100,91 @@ class cuttersmartpower(cutter):
     def is_on(self):
         """docstring for is_on"""
         super(cuttersmartpower, self).is_on()
-        c = self._getstatuscmd.format(cport=self._cport)
-        out = check_output(c, shell=True,
-                           stderr=subprocess.DEVNULL, timeout=10)
+        out = self._read_status()
 
-        if find_pattern(pattern=r'[0-9].[0-9]{3}W', data=out):
+        if find_pattern(pattern=self._pattern_power, data=out):
             return True
         else:
             return False
+
+    def read_power(self):
+        """
+        Return voltage(V), current(A) and power(W) of the cutter output.
+
+        Example:
+            >>> dut._cutter.read_power()
+            {'voltage': 5.102, 'current': 0.398, 'power': 2.031}
+
+        :returns dict: measured values. values are 0.0 if power is off.
+        """
+        out = self._read_status()
+        result = {}
+        for key, unit in (('voltage', 'V'), ('current', 'A'),
+                          ('power', 'W')):
+            value = find_pattern(r'([0-9]+\.[0-9]+){}(?!h)'.format(unit),
+                                 out, groupindex=1)
+            result[key] = float(value) if value else 0.0
+        return result
+
+    def _toggle(self):
+        """docstring for _toggle"""
+        if self._hid is not None:
+            try:
+                self._request(self._request_onoff, reply=False)
+                time.sleep(self._hid_settle)
+                return
+            except OSError as e:
+                logging.debug(e)
+                self._close_hid()
+        c = self._controlcmd.format(cport=self._cport)
+        call(c, shell=True, stderr=subprocess.DEVNULL, timeout=10)
+
+    def _read_status(self):
+        """docstring for _read_status"""
+        if self._hid is not None:
+            try:
+                return decode(self._request(self._request_data))
+            except OSError as e:
+                logging.debug(e)
+                self._close_hid()
+        c = self._getstatuscmd.format(cport=self._cport)
+        return check_output(c, shell=True,
+                            stderr=subprocess.DEVNULL, timeout=10)
+
+    def _open_hid(self):
+        """docstring for _open_hid"""
+        try:
+            self._hid = os.open(self._cport, os.O_RDWR)
+        except OSError as e:
+            logging.debug('Can\'t open {0} : {1}'.format(self._cport, e))
+            self._hid = None
+
+    def _close_hid(self):
+        """docstring for _close_hid"""
+        if self._hid is not None:
+            try:
+                os.close(self._hid)
+            except OSError:
+                pass
+            self._hid = None
+
+    def _request(self, request, reply=True):
+        """docstring for _request"""
+        # first byte is report id. SmartPower doesn't use numbered reports.
+        buf = bytes([0, request]) + bytes(self._report_size - 1)
+        with self._hid_lock:
+            os.write(self._hid, buf)
+            if not reply:
+                return None
+            deadline = time.perf_counter() + self._hid_timeout
+            while True:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    raise OSError('smartpower hid timeout')
+                readable, _, _ = select.select([self._hid], [], [], remaining)
+                if not readable:
+                    continue
+                data = os.read(self._hid, self._report_size)
+                # skip stale replies of other requests
+                if data and data[0] == request:
+                    return data[1:]
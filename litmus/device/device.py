@@ -14,8 +14,14 @@
 # limitations under the License.
 
 import os
+import math
 import time
+import hashlib
+import shlex
 import serial
+import tarfile
+import uuid
+import posixpath
 import logging
 import tempfile
 import fasteners
@@ -26,8 +32,15 @@ from litmus.core.util import convert_single_item_to_list
 from litmus.core.util import find_pattern
 from litmus.core.util import decode
 from litmus.core.util import create_instance
+from litmus.core.util import process_watch
+from litmus.core.util import watched_executor
 from litmus.core.util import find_all_pattern
 from litmus.core.exceptions import BootError
+from litmus.core.imagecache import imagecache
+from litmus.core.powersampler import powersampler
+from litmus.core.powersettle import powersettle
+from litmus.core.resultwriter import resultwriter
+from litmus.core import xwd
 from litmus.device.cutter import cutter
 from litmus import _path_for_locks_
 
@@ -56,6 +69,11 @@ class device(object):
     _path_for_locks = _path_for_locks_
     _screen_width = 1920
     _screen_height = 1080
+    _pattern_winid = r'.*(0x[a-zA-Z0-9]{8})\s+\d+\s+\d+\s+\d+' \
+                     r'\s+\d+\s+(\d+)\s+(\d+).*[0]{1}\s+\d+\s+[NV]{1}.*'
+    _pattern_dumpdir = r'directory:\s(.*)'
+    _path_for_frames = '/tmp/litmus_frames'
+    _archive_done = 'litmus_archive_done'
 
     _cutter = None
     _uart = None
@@ -66,6 +84,16 @@ class device(object):
 
     _name = None
     _tests = None
+    _device_info = None
+    _state = None
+    _state_updated_at = None
+    _state_ttl = 2.0
+    _powersampler = None
+    _watchdog_grace = 5
+    _powersettle = None
+    _powercut_delay = 1
+    _powercut_max_delay = 4
+    _drained_power = 0.05
 
     def __init__(self, *args, **kwargs):
         super(device, self).__init__()
@@ -75,6 +103,7 @@ class device(object):
 
         # init a cutter instance.
         self._cutter = cutter.create(*args, **kwargs)
+        self._powersettle = powersettle(self._name)
         # open uart
         self._open_uart()
         self._manager = kwargs['manager']
@@ -132,6 +161,9 @@ class device(object):
         """
         Turn on the acquired device.
 
+        Power is cut before turning on. The power-off delay is learned per
+        device from the output power of cutters which can measure it.
+
         :param float powercut_delay: power-cut delay for cutter
 
         Example:
@@ -143,7 +175,7 @@ class device(object):
         retry_cnt = 0
         while retry_cnt <= self._max_attempt_boot_retry:
             try:
-                self.off(1)
+                self.off()
                 self._cutter.on(powercut_delay)
                 self._uart.close()
                 self._uart.open()
@@ -152,22 +184,27 @@ class device(object):
                 self._set_sdb_deviceid()
                 self._attach_sdb()
                 self.sdb_root_on()
+                self._load_device_info()
+                self._set_state(power=True)
                 return
             except KeyboardInterrupt:
                 self.off(1)
                 raise Exception('Keyboard interrupt.')
             except Exception as e:
                 logging.debug(e)
+                # don't trust tuned delays after a boot failure
+                self._powersettle.reset('off')
                 retry_cnt += 1
         else:
             self.off(1)
             raise BootError('Can\'t turn on dut.')
 
-    def off(self, powercut_delay=1):
+    def off(self, powercut_delay=None):
         """
         Trun off the acquired device.
 
-        :param float powercut_delay: power-cut delay for cutter
+        :param float powercut_delay: power-cut delay for cutter. \
+                If None, the delay learned for the device is used.
 
         Example:
             >>> dut.off()
@@ -175,13 +212,21 @@ class device(object):
         """
         logging.debug('=================Turn off device {}================='
                       .format(self.get_name()))
+        self._device_info = None
         self._detach_sdb()
-        self._cutter.off(powercut_delay)
+        self._cut_power(powercut_delay)
+        self._set_state(power=False, uart=False, sdb=False, root=False)
 
-    def is_on(self):
+    def is_on(self, refresh=False):
         """
         Return whether device is turned on or not.
 
+        The state is tracked from power and sdb events of this instance.
+        sdb is probed only if the state is unknown, the last event or
+        probed result is older than a couple of seconds or refresh is True.
+
+        :param bool refresh: probe sdb regardless of tracked state
+
         Example:
             >>> dut.on()
             >>> dut.is_on()
@@ -192,19 +237,44 @@ class device(object):
 
         :returns boolean: true if device is turned on, false otherwise.
         """
-        pattern = '.*{}'.format(self.get_id())
-        outs = check_output('sdb devices'.split(), timeout=10)
-        if find_pattern(pattern, outs):
-            return True
-        else:
-            return False
+        state = self._get_state_dict()
+        if (refresh or state['sdb'] is None or
+                time.perf_counter() - self._state_updated_at >
+                self._state_ttl):
+            self._probe_sdb()
+        return state['sdb']
+
+    def get_state(self, refresh=False):
+        """
+        Return tracked power and connection state of the device.
+
+        Each value is True, False or None if it is unknown.
+
+        :param bool refresh: probe sdb and power cutter before returning
+
+        Example:
+            >>> dut.on()
+            >>> dut.get_state()
+            {'power': True, 'uart': True, 'sdb': True, 'root': True}
+
+        :returns dict: state of power, uart shell, sdb connection and root
+        """
+        state = self._get_state_dict()
+        if refresh:
+            self._probe_sdb()
+            if self._cutter:
+                state['power'] = self._cutter.is_on()
+        return dict(state)
 
     def flash(self, filenames, flasher='lthor', waiting=5):
         """
         Flash binaries to device.
         This function turn on device and turn off device automatically.
 
-        :param dict filenames: filename string or dict
+        :param dict filenames: filename string or dict. background_download \
+                instances are accepted and waited for just before lthor \
+                runs, so downloading overlaps entering download mode but \
+                not the USB transfer.
         :param sting flasher: external flashing tool name
         :param float waiting: waiting time to acquire cdc_acm device
 
@@ -224,6 +294,7 @@ class device(object):
             self._acquire_global_lock()
             time.sleep(waiting)
             self._enter_download_mode(self._dnmode_cmd)
+            self._set_state(uart=False, sdb=False, root=False)
             time.sleep(waiting)
             busid = self._find_usb_busid()
             self._release_global_lock()
@@ -299,6 +370,187 @@ class device(object):
         result = check_output(c, timeout=timeout)
         return result
 
+    def sync_to(self, local_dir, remote_dir, jobs=4, timeout=None,
+                packed=False):
+        """
+        Synchronize a directory of host to a directory of device.
+        Only new or changed files are pushed. Checksums of device files
+        are calculated by a single sdb shell command.
+
+        :param str local_dir: directory path from host pc
+        :param str remote_dir: directory path of device
+        :param int jobs: number of concurrent transfers
+        :param float timeout: timeout for each transfer
+        :param bool packed: push changed files as one tar archive
+
+        Example:
+            >>> dut.sync_to('payload', '/opt/usr/payload')
+            ['bin/test', 'data/input.txt']
+
+        :returns list: relative paths of pushed files
+        """
+        logging.debug('==============Sync a directory to device {}========='
+                      .format(self.get_name()))
+        local = self._local_checksums(local_dir)
+        remote = self._remote_checksums(remote_dir)
+        changed = sorted(k for k, v in local.items() if remote.get(k) != v)
+        logging.debug('{0} of {1} files changed'.format(len(changed),
+                                                        len(local)))
+        if not changed:
+            return changed
+
+        if packed:
+            self._push_archive([(os.path.join(local_dir, l), l)
+                                for l in changed], remote_dir,
+                               timeout=timeout)
+            return changed
+
+        dirs = set(os.path.dirname(l) for l in changed)
+        self.run_cmd('mkdir -p ' + ' '.join(
+            shlex.quote(posixpath.join(remote_dir, d)) for d in sorted(dirs)),
+            timeout=20)
+
+        def _push(l):
+            self.push_file(os.path.join(local_dir, l),
+                           posixpath.join(remote_dir, l), timeout=timeout)
+
+        with watched_executor(max_workers=jobs) as executor:
+            list(executor.map(_push, changed))
+        return changed
+
+    def sync_from(self, remote_dir, local_dir, jobs=4, timeout=None,
+                  packed=False):
+        """
+        Synchronize a directory of device to a directory of host.
+        Only new or changed files are pulled. Checksums of device files
+        are calculated by a single sdb shell command.
+
+        :param str remote_dir: directory path of device
+        :param str local_dir: directory path from host pc
+        :param int jobs: number of concurrent transfers
+        :param float timeout: timeout for each transfer
+        :param bool packed: pull changed files as one tar archive
+
+        Example:
+            >>> dut.sync_from('/opt/usr/result', 'result')
+            ['log.txt']
+
+        :returns list: relative paths of pulled files
+        """
+        logging.debug('==============Sync a directory from device {}======='
+                      .format(self.get_name()))
+        remote = self._remote_checksums(remote_dir)
+        local = self._local_checksums(local_dir)
+        changed = sorted(k for k, v in remote.items() if local.get(k) != v)
+        logging.debug('{0} of {1} files changed'.format(len(changed),
+                                                        len(remote)))
+        if packed and changed:
+            self._pull_archive(remote_dir, changed, local_dir,
+                               timeout=timeout)
+            return changed
+
+        def _pull(l):
+            dest = os.path.join(local_dir, l)
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            self.pull_file(posixpath.join(remote_dir, l), dest,
+                           timeout=timeout)
+
+        with watched_executor(max_workers=jobs) as executor:
+            list(executor.map(_pull, changed))
+        return changed
+
+    def push_packed(self, src, dest, compress=False, timeout=None):
+        """
+        Push files and directories from host to device as one tar archive.
+        Only one file is transferred regardless of the number of files.
+
+        :param list src: file or directory path string or list from host pc
+        :param str dest: destination directory of device
+        :param bool compress: compress the archive with gzip
+        :param float timeout: timeout
+
+        Example:
+            >>> dut.push_packed(['payload', 'run.sh'], '/opt/usr')
+
+        """
+        logging.debug('==============Push packed files to device {}========'
+                      .format(self.get_name()))
+        members = [(l, os.path.basename(os.path.normpath(l)))
+                   for l in convert_single_item_to_list(src)]
+        self._push_archive(members, dest, compress=compress, timeout=timeout)
+
+    def pull_packed(self, src, dest, compress=False, timeout=None):
+        """
+        Pull a directory from device to host as one tar archive.
+        Only one file is transferred regardless of the number of files.
+
+        :param str src: directory path of device
+        :param str dest: destination directory of host pc
+        :param bool compress: compress the archive with gzip
+        :param float timeout: timeout
+
+        Example:
+            >>> dut.pull_packed('/opt/usr/result', 'result')
+
+        """
+        logging.debug('==============Pull packed files from device {}======'
+                      .format(self.get_name()))
+        self._pull_archive(src, ['.'], dest, compress=compress,
+                           timeout=timeout)
+
+    def _push_archive(self, members, dest, compress=False, timeout=None):
+        """docstring for _push_archive"""
+        remote = '/tmp/litmus_{}.tar'.format(uuid.uuid4().hex)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            archive = os.path.join(tmpdir, 'packed.tar')
+            if compress:
+                tar = tarfile.open(archive, 'w:gz', compresslevel=1)
+            else:
+                tar = tarfile.open(archive, 'w')
+            with tar:
+                for path, arcname in members:
+                    tar.add(path, arcname=arcname)
+            self.push_file(archive, remote, timeout=timeout)
+        result = self.run_cmd('mkdir -p {0} && tar x{1}f {2} -C {0} '
+                              '&& echo {3}; rm -f {2}'
+                              .format(shlex.quote(dest),
+                                      'z' if compress else '',
+                                      remote, self._archive_done),
+                              timeout=timeout)
+        if self._archive_done not in (result or ''):
+            raise Exception('Can\'t extract files to {0} : {1}'
+                            .format(dest, result))
+
+    def _pull_archive(self, src, names, dest, compress=False, timeout=None):
+        """docstring for _pull_archive"""
+        remote = '/tmp/litmus_{}.tar'.format(uuid.uuid4().hex)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            if names == ['.']:
+                members = '.'
+            else:
+                # pass the file list by a file to avoid long command lines
+                listfile = os.path.join(tmpdir, 'list')
+                with open(listfile, 'w') as f:
+                    f.write('\n'.join(names) + '\n')
+                self.push_file(listfile, remote + '.list', timeout=timeout)
+                members = '-T {}.list'.format(remote)
+            result = self.run_cmd('tar c{0}f {1} -C {2} {3} && echo {4}; '
+                                  'rm -f {1}.list'
+                                  .format('z' if compress else '', remote,
+                                          shlex.quote(src), members,
+                                          self._archive_done),
+                                  timeout=timeout)
+            if self._archive_done not in (result or ''):
+                self.run_cmd('rm -f {}'.format(remote), timeout=20)
+                raise Exception('Can\'t archive files in {0} : {1}'
+                                .format(src, result))
+            archive = os.path.join(tmpdir, 'packed.tar')
+            self.pull_file(remote, archive, timeout=timeout)
+            self.run_cmd('rm -f {}'.format(remote), timeout=20)
+            os.makedirs(dest, exist_ok=True)
+            with tarfile.open(archive, 'r:*') as tar:
+                tar.extractall(dest)
+
     def _read_uart(self, bufsize=100):
         """docstring for read_uart"""
         readdata = decode(self._uart.read(bufsize))
@@ -312,12 +564,16 @@ class device(object):
         if returnkey:
             self._uart.write(returnkey)
 
-    def add_test(self, func, args):
+    def add_test(self, func, args, shareable=None, timeout=None):
         """
         Add a testcase to device class instance.
 
         :param func func: function object for test
         :param dict args: arguments for test function
+        :param bool shareable: True if the test can run concurrently with \
+                other shareable tests. If None, shareable attribute of func \
+                is used and tests are exclusive by default.
+        :param float timeout: deadline of the test in seconds
 
         Example:
             >>> from litmus.helper.helper import verify_wifi_is_working
@@ -329,8 +585,11 @@ class device(object):
         """
         if not self._tests:
             self._tests = []
+        if shareable is None:
+            shareable = getattr(func, 'shareable', False)
 
-        self._tests.append({'func': func, 'args': args})
+        self._tests.append({'func': func, 'args': args,
+                            'shareable': shareable, 'timeout': timeout})
 
     def del_test(self, func):
         """
@@ -344,30 +603,199 @@ class device(object):
         """
         self._tests = [l for l in self._tests if l['func'] != func]
 
-    def run_tests(self):
+    def run_tests(self, parallel=1, timeout=None, test_timeout=None,
+                  result_dir=None):
         """
         Run all testcases.
 
+        Consecutive shareable testcases run concurrently in up to parallel
+        threads. Each of them uses its own sdb sessions. Exclusive
+        testcases run alone in the order they were added.
+
+        If a testcase passes its deadline, a watchdog kills subprocesses
+        which the testcase started (e.g. sdb shell), records a timeout and
+        continues with the remaining testcases. Testcases which are not
+        started before the suite deadline are skipped.
+
+        If power sampling is started, the power consumption of each
+        testcase is added to its result.
+
+        :param int parallel: max number of concurrent shareable testcases
+        :param float timeout: deadline of all testcases in seconds
+        :param float test_timeout: default deadline of a testcase in seconds
+        :param str result_dir: directory to save results of testcases as \
+                testresult_run_tests.xml (JUnit) and .jsonl
+
         Example:
             >>> from litmus.helper.helper import verify_wifi_is_working
             >>> dut.add_test(verify_wifi_is_working,
                              {'wifi_apname': 'setup',
                               'wifi_password': '',
                               'result_dir': 'result'})
-            >>> dut.run_tests()
+            >>> dut.run_tests(parallel=4, timeout=600, test_timeout=120)
+            [{'name': 'verify_wifi_is_working', 'result': 'passed',
+              'duration': 3.2,
+              'power': {'mean_power': 2.1, 'peak_power': 3.5, ...}}]
+
+        :returns list: result, duration and power of each testcase
+        """
+        suite_deadline = time.perf_counter() + timeout if timeout else None
+        batches = []
+        for l in self._tests or []:
+            if (parallel > 1 and l.get('shareable') and batches and
+                    batches[-1][0].get('shareable')):
+                batches[-1].append(l)
+            else:
+                batches.append([l])
+
+        results = []
+        for batch in batches:
+            if len(batch) == 1:
+                results.append(self._run_test(batch[0], suite_deadline,
+                                              test_timeout))
+                continue
+            with watched_executor(max_workers=parallel) as executor:
+                futures = [executor.submit(self._run_test, l, suite_deadline,
+                                           test_timeout) for l in batch]
+            results.extend(f.result() for f in futures)
+        if result_dir:
+            self._save_test_results(results, result_dir)
+        return results
+
+    def _save_test_results(self, results, result_dir):
+        """docstring for _save_test_results"""
+        with resultwriter(result_dir, 'testresult_run_tests',
+                          self.get_name()) as writer:
+            for l in results:
+                power = l.get('power')
+                properties = None
+                if power:
+                    properties = dict((key, round(power[key], 3))
+                                      for key in ('mean_power', 'peak_power',
+                                                  'energy'))
+                writer.add(l['name'], l['result'] == 'passed',
+                           duration=l['duration'],
+                           message=None if l['result'] == 'passed'
+                           else l['result'],
+                           properties=properties)
+
+    def _run_test(self, test, suite_deadline=None, test_timeout=None):
+        """docstring for _run_test"""
+        name = test['func'].__name__
+        start_time = time.perf_counter()
+        deadlines = [l for l in (suite_deadline,) if l]
+        if test.get('timeout') or test_timeout:
+            deadlines.append(start_time +
+                             (test.get('timeout') or test_timeout))
+        deadline = min(deadlines) if deadlines else None
+        if deadline is not None and deadline <= start_time:
+            logging.debug('Skip {} : suite deadline passed'.format(name))
+            return {'name': name, 'result': 'skipped', 'duration': 0.0}
+
+        sampler = self._powersampler
+        if sampler:
+            mark = sampler.mark(name)
+        try:
+            if deadline is None:
+                self._call_test(test)
+                result = 'passed'
+            else:
+                result = self._call_test_with_watchdog(test, deadline)
+        finally:
+            if sampler:
+                sampler.mark(name, begin=False, key=mark)
+        result = {'name': name, 'result': result,
+                  'duration': time.perf_counter() - start_time}
+        if sampler:
+            result['power'] = sampler.segment(mark)
+        return result
+
+    def _call_test(self, test):
+        """docstring for _call_test"""
+        if isinstance(test['args'], dict):
+            test['func'](self, **test['args'])
+        elif isinstance(test['args'], tuple):
+            test['func'](self, *test['args'])
+
+    def _call_test_with_watchdog(self, test, deadline):
+        """docstring for _call_test_with_watchdog"""
+        watch = process_watch()
+        errors = []
+
+        def _target():
+            with watch:
+                try:
+                    self._call_test(test)
+                except BaseException as e:
+                    errors.append(e)
+
+        t = Thread(target=_target, daemon=True)
+        t.start()
+        t.join(max(0, deadline - time.perf_counter()))
+        if t.is_alive():
+            logging.debug('{} timed out. kill its subprocesses.'
+                          .format(test['func'].__name__))
+            watch.kill()
+            t.join(self._watchdog_grace)
+            return 'timeout'
+        if errors:
+            raise errors[0]
+        return 'passed'
+
+    def start_power_sampling(self, rate=10):
+        """
+        Start sampling voltage, current and power of the device.
+
+        Samples are taken from the cutter in a background thread. While
+        sampling, run_tests marks the boundaries of each testcase and adds
+        its power and energy to the testcase result.
+
+        :param float rate: samples per second
 
+        Example:
+            >>> dut.on()
+            >>> dut.start_power_sampling(rate=10)
+            >>> dut.run_tests(result_dir='result')
+            >>> dut.stop_power_sampling('result/power.json')
+
+        """
+        if self._cutter.read_power() is None:
+            raise Exception('Can\'t measure power with this cutter.')
+        self.stop_power_sampling()
+        self._powersampler = powersampler(self._cutter.read_power, rate)
+        self._powersampler.start()
+
+    def stop_power_sampling(self, filename=None):
+        """
+        Stop sampling power and return the summary.
+
+        :param str filename: json file to save summary and samples
+
+        Example:
+            >>> dut.stop_power_sampling()
+            {'total': {'duration': 12.1, 'samples': 121,
+                       'mean_power': 2.13, 'peak_power': 3.52,
+                       'energy': 25.8},
+             'segments': [{'label': 'verify_dmesg', 'duration': 1.2, ...}]}
+
+        :returns dict: power summary or None if sampling is not started
         """
-        for l in self._tests:
-            if isinstance(l['args'], dict):
-                l['func'](self, **l['args'])
-            elif isinstance(l['args'], tuple):
-                l['func'](self, *l['args'])
+        sampler = self._powersampler
+        if not sampler:
+            return None
+        self._powersampler = None
+        sampler.stop()
+        if filename:
+            sampler.save(filename)
+        return sampler.summary()
 
-    def screenshot(self, filename):
+    def screenshot(self, filename, compress_level=6):
         """
         Take a screenshot (png format)
 
         :param str filename: screenshot file name
+        :param int compress_level: png compression level (0-9). lower is \
+                faster and bigger
 
         Example:
             >>> dut.screenshot('screenshot.png')
@@ -379,72 +807,281 @@ class device(object):
                               self._screen_height))
         dt = self._get_display_server_type()
         if dt == 'X11':
-            self._screenshot_x11(filename)
+            self._screenshot_x11(filename, compress_level)
         elif dt == 'WAYLAND':
-            self._screenshot_wayland(filename)
+            self._screenshot_wayland(filename, compress_level)
+
+    def capture_frames(self, dirname, duration=5, fps=10, compress_level=1):
+        """
+        Capture screen frames for a while and save distinct frames as png.
+
+        A capture loop runs on device in a single sdb shell session and all
+        frames are pulled at once afterwards. A frame which is identical
+        to its predecessor is dropped, so the timestamp of the last frame
+        tells when the screen has settled.
+
+        :param str dirname: directory to save frames
+        :param float duration: capture duration in seconds
+        :param float fps: frames per second to capture
+        :param int compress_level: png compression level (0-9)
+
+        Example:
+            >>> dut.run_cmd('launch_app org.tizen.setting')
+            >>> frames = dut.capture_frames('frames', duration=3)
+            >>> frames[-1]
+            (1.203, 'frames/frame_00007.png')
+
+        :returns list: (timestamp, filename) of saved frames. timestamp is \
+                seconds since the first captured frame.
+        """
+        logging.debug('==== Capture frames: {}, duration: {}, fps: {} ===='
+                      .format(dirname, duration, fps))
+        if self._get_display_server_type() == 'X11':
+            capture = 'xwd -root -out $t.xwd'
+        else:
+            capture = ('mkdir $t; cd $t; '
+                       'enlightenment_info -topvwins > topvwins; '
+                       'enlightenment_info -dump_topvwins > dump; cd ..')
+        cmd = ('rm -rf {0}; mkdir -p {0}; cd {0}; '
+               'end=$(($(date +%s)+{1})); '
+               'while [ $(date +%s) -lt $end ]; do '
+               't=$(date +%s%N); {2}; sleep {3}; done'
+               .format(self._path_for_frames, int(math.ceil(duration)),
+                       capture, 1.0 / fps))
+        self.run_cmd(cmd, timeout=duration + 60)
+
+        os.makedirs(dirname, exist_ok=True)
+        frames = []
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self.pull_file(self._path_for_frames, tmpdir, timeout=120)
+            self.run_cmd('rm -rf {}'.format(self._path_for_frames),
+                         timeout=20)
+            names = sorted(os.listdir(tmpdir),
+                           key=lambda x: int(x.split('.')[0]))
+
+            def _load(name):
+                path = os.path.join(tmpdir, name)
+                if name.endswith('.xwd'):
+                    im = self._load_xwd(path)
+                else:
+                    with open(os.path.join(path, 'topvwins')) as f:
+                        winids = find_all_pattern(self._pattern_winid,
+                                                  f.read())
+                    with open(os.path.join(path, 'dump')) as f:
+                        dirn = find_pattern(self._pattern_dumpdir, f.read(),
+                                            groupindex=1)
+                    dumpdir = os.path.join(path,
+                                           os.path.basename(dirn.rstrip()))
+                    im = self._compose_windows(winids, dumpdir)
+                return im, hashlib.sha1(im.tobytes()).digest()
+
+            with watched_executor(max_workers=4) as executor:
+                loaded = executor.map(_load, names)
+                prev = None
+                for name, (im, digest) in zip(names, loaded):
+                    if digest == prev:
+                        continue
+                    prev = digest
+                    timestamp = (int(name.split('.')[0]) -
+                                 int(names[0].split('.')[0])) / 1e9
+                    filename = os.path.join(dirname, 'frame_{:05d}.png'
+                                            .format(len(frames)))
+                    im.save(filename, compress_level=compress_level)
+                    frames.append((timestamp, filename))
+
+        with open(os.path.join(dirname, 'frames.txt'), 'w') as f:
+            for timestamp, filename in frames:
+                f.write('{0:.3f} {1}\n'.format(timestamp,
+                                               os.path.basename(filename)))
+        logging.debug('{0} distinct frames out of {1}'.format(len(frames),
+                                                              len(names)))
+        return frames
+
+    def get_device_info(self):
+        """
+        Return static facts of the device for current boot.
+
+        Facts are queried once by a single sdb shell command and cached
+        until the device is turned off, rebooted or flashed.
+
+        Example:
+            >>> dut.on()
+            >>> dut.get_device_info()
+            {'display_server': 'WAYLAND',
+             'kernel_version': '3.10.65',
+             'tizen_release': 'Tizen 4.0.0 (Tizen4/Mobile)',
+             'screen_resolution': '720,1280'}
+
+        :returns dict: device facts
+        """
+        if not self._device_info:
+            self._load_device_info()
+        return self._device_info
 
     # private methods.
+    def _load_device_info(self):
+        """docstring for _load_device_info"""
+        cmds = ['ls /usr/lib | grep -c libX11',
+                'uname -r',
+                'head -n 1 /etc/tizen-release',
+                'cat /sys/class/graphics/fb0/virtual_size']
+        try:
+            res = self.run_cmd('; echo @@; '.join(cmds) + '; echo @@',
+                               timeout=10)
+        except Exception as e:
+            logging.debug(e)
+            res = None
+        outs = [l.strip() for l in res.split('@@')] if res else []
+        if len(outs) < len(cmds):
+            logging.debug('Can\'t get device info')
+            self._device_info = None
+            return
+        x11 = outs[0].isdigit() and int(outs[0]) > 0
+        self._device_info = {'display_server': 'X11' if x11 else 'WAYLAND',
+                             'kernel_version': outs[1],
+                             'tizen_release': outs[2],
+                             'screen_resolution': outs[3]}
+        logging.debug('device info : {}'.format(self._device_info))
+
+    def _get_state_dict(self):
+        """docstring for _get_state_dict"""
+        if self._state is None:
+            self._state = {'power': None, 'uart': None,
+                           'sdb': None, 'root': None}
+        return self._state
+
+    def _set_state(self, **kwargs):
+        """docstring for _set_state"""
+        self._get_state_dict().update(kwargs)
+        if 'sdb' in kwargs:
+            # states from events expire like probed ones so that a device
+            # which reboots or panics outside litmus is noticed
+            self._state_updated_at = time.perf_counter()
+
+    def _probe_sdb(self):
+        """docstring for _probe_sdb"""
+        pattern = '.*{}'.format(self.get_id())
+        outs = check_output('sdb devices'.split(), timeout=10)
+        found = bool(find_pattern(pattern, outs))
+        self._get_state_dict()['sdb'] = found
+        if not found:
+            self._state['root'] = False
+        self._state_updated_at = time.perf_counter()
+        return found
+
+    def _remote_checksums(self, remote_dir):
+        """docstring for _remote_checksums"""
+        cmd = 'cd {} 2>/dev/null && find . -type f -exec md5sum {{}} +' \
+              .format(shlex.quote(remote_dir))
+        outs = self.run_cmd(cmd, timeout=60)
+        return {path: md5 for md5, path
+                in find_all_pattern(r'(?m)^([0-9a-f]{32})\s+\./(.*?)\r?$',
+                                    outs)}
+
+    def _local_checksums(self, local_dir):
+        """docstring for _local_checksums"""
+        checksums = {}
+        if not os.path.isdir(local_dir):
+            return checksums
+        for root, dirs, files in os.walk(local_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                h = hashlib.md5()
+                with open(path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                        h.update(chunk)
+                rel = os.path.relpath(path, local_dir).replace(os.sep, '/')
+                checksums[rel] = h.hexdigest()
+        return checksums
+
     def _get_display_server_type(self):
         """docstring for get_display_server_type"""
-        res = self.run_cmd('ls /usr/lib', timeout=10)
-        if find_pattern('.*libX11.*', res):
-            return 'X11'
-        else:
-            return 'WAYLAND'
+        info = self.get_device_info()
+        return info['display_server'] if info else 'WAYLAND'
 
-    def _screenshot_x11(self, filename):
+    def _screenshot_x11(self, filename, compress_level=6):
         """docstring for _screenshot_x11"""
         # take a screenshot using xwd
-        cmd = 'xwd -root -out /tmp/{}.xwd'.format(filename)
-        self.run_cmd(cmd, timeout=20)
-
-        # pull xwd file
-        self.pull_file('/tmp/{}.xwd'.format(filename), os.curdir, timeout=20)
-
-        # convert xwd to png and resize it
-        call(['convert', '{0}.xwd'.format(filename), '-resize',
-              '{0}x{1}'.format(self._screen_width, self._screen_height),
-              filename], timeout=20)
-        call(['rm', '{}.xwd'.format(filename)], timeout=20)
-
-    def _screenshot_wayland(self, filename):
+        xwdname = '/tmp/{}.xwd'.format(os.path.basename(filename))
+        self.run_cmd('xwd -root -out {}'.format(xwdname), timeout=20)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            # pull xwd file
+            self.pull_file(xwdname, tmpdir, timeout=20)
+
+            # decode xwd and resize it to fit in the screen size
+            im = self._load_xwd(os.path.join(tmpdir,
+                                             os.path.basename(xwdname)))
+            im.save(filename, compress_level=compress_level)
+
+    def _load_xwd(self, filename):
+        """docstring for _load_xwd"""
+        im = xwd.load(filename)
+        ratio = min(self._screen_width / im.size[0],
+                    self._screen_height / im.size[1])
+        size = (round(im.size[0] * ratio), round(im.size[1] * ratio))
+        if size != im.size:
+            im = im.resize(size, Image.LANCZOS)
+        return im
+
+    def _screenshot_wayland(self, filename, compress_level=6):
         """docstring for _screenshot_wayland"""
         # Find all viewable window id
-        p_winid = '.*(0x[a-zA-Z0-9]{8})\s+\d+\s+\d+\s+\d+' \
-                  '\s+\d+\s+(\d+)\s+(\d+).*[0]{1}\s+\d+\s+[NV]{1}.*'
-        winids = find_all_pattern(p_winid,
+        winids = find_all_pattern(self._pattern_winid,
                                   self.run_cmd('enlightenment_info -topvwins',
                                                timeout=20))
         if winids:
             # Dump windows
             outs = self.run_cmd('cd /tmp; enlightenment_info -dump_topvwins',
                                 timeout=20)
-            dirn = find_pattern('directory:\s(.*)',
+            dirn = find_pattern(self._pattern_dumpdir,
                                 outs,
                                 groupindex=1).rstrip()
 
             # Create tempdir and pull dump files
-            tmpdir = tempfile.mkdtemp()
-            self.pull_file(dirn, tmpdir, timeout=20)
-
-            # If dump does not exist then remove winid from list
-            winids = [winid for winid in winids
-                      if os.path.exists(os.path.join(tmpdir,
-                                                     winid[0]+'_0.png'))]
-
-            # Base image
-            bg = Image.new('RGB', (self._screen_width, self._screen_height))
-            # Merge images
-            for winid in reversed(winids):
-                try:
-                    fg = Image.open(os.path.join(tmpdir, winid[0]+'_0.png'))
-                    bg.paste(fg, (int(winid[1]), int(winid[2])), fg)
-                except FileNotFoundError:
-                    pass
-            # Save merged image
-            bg.save(filename)
-            # Remove tempdir
-            call(['rm', '-rf', tmpdir], timeout=10)
+            with tempfile.TemporaryDirectory() as tmpdir:
+                self.pull_file(dirn, tmpdir, timeout=20)
+
+                # Merge images and save merged image
+                self._compose_windows(winids, tmpdir).save(
+                    filename, compress_level=compress_level)
+
+    def _compose_windows(self, winids, dumpdir):
+        """docstring for _compose_windows"""
+        # If dump does not exist then remove winid from list
+        dumps = [(os.path.join(dumpdir, winid[0]+'_0.png'),
+                  (int(winid[1]), int(winid[2])))
+                 for winid in winids
+                 if os.path.exists(os.path.join(dumpdir, winid[0]+'_0.png'))]
+        size = (self._screen_width, self._screen_height)
+
+        def _load(dump):
+            fg = Image.open(dump[0])
+            fg.load()
+            return fg
+
+        # Decode window dumps concurrently. dumps are ordered from top.
+        with watched_executor(max_workers=4) as executor:
+            fgs = list(executor.map(_load, dumps))
+
+        # Windows below an opaque window which covers the whole screen
+        # are not visible.
+        for idx, (fg, dump) in enumerate(zip(fgs, dumps)):
+            covered = (dump[1] == (0, 0) and
+                       fg.size[0] >= size[0] and fg.size[1] >= size[1])
+            opaque = ('A' not in fg.getbands() or
+                      fg.getchannel('A').getextrema()[0] == 255)
+            if covered and opaque:
+                fgs = fgs[:idx+1]
+                break
+
+        # Base image
+        bg = Image.new('RGBA', size, (0, 0, 0, 255))
+        for fg, dump in reversed(list(zip(fgs, dumps))):
+            if fg.mode != 'RGBA':
+                fg = fg.convert('RGBA')
+            bg.alpha_composite(fg, dest=dump[1])
+        return bg.convert('RGB')
 
     def _flush_uart_buffer(self):
         """docstring for flush_uart_buffer"""
@@ -493,15 +1130,55 @@ class device(object):
             time.sleep(0.1)
             self._uart.write(self._enterkey)
 
-    def _enter_download_mode(self, cmd, powercut_delay=1, thread_param=10):
+    def _enter_download_mode(self, cmd, powercut_delay=None,
+                             thread_param=10):
         """docstring for _enter_download_mode"""
         t = Thread(target=self._thread_for_enter_download_mode,
                    args=(cmd, thread_param, ))
         t.start()
+        # uart belongs to the thread here. don't measure the drain.
+        if powercut_delay is None:
+            powercut_delay = self._get_powercut_delay()
         self._cutter.off(delay=powercut_delay)
         self._cutter.on(delay=powercut_delay)
         t.join()
 
+    def _get_powercut_delay(self):
+        """docstring for _get_powercut_delay"""
+        return self._powersettle.get('off', self._powercut_delay,
+                                     maximum=self._powercut_max_delay)
+
+    def _cut_power(self, powercut_delay=None):
+        """docstring for _cut_power"""
+        if powercut_delay is not None:
+            self._cutter.off(delay=powercut_delay)
+            return
+        delay = self._get_powercut_delay()
+        # measure from the relay toggle, not from the confirmed off state
+        started = time.perf_counter()
+        self._cutter.off(delay=0)
+        drained = self._wait_power_drained(started, delay)
+        if drained is not None:
+            self._powersettle.record('off', drained)
+        time.sleep(max(0, delay - (time.perf_counter() - started)))
+
+    def _wait_power_drained(self, started, timeout):
+        """docstring for _wait_power_drained"""
+        # only the current tail measured by cutter tells that the board is
+        # drained. if the cutter reads zero right after the toggle, it
+        # shows its relay, not the board, and nothing is learned.
+        power = self._cutter.read_power()
+        if power is None or power['power'] <= self._drained_power:
+            return None
+        while time.perf_counter() - started < timeout:
+            time.sleep(0.05)
+            power = self._cutter.read_power()
+            if power is None or power['power'] <= self._drained_power:
+                return time.perf_counter() - started
+        # record timeouts too so that the delay can grow
+        logging.debug('Power is not drained in {:.2f}s'.format(timeout))
+        return time.perf_counter() - started
+
     def _find_usb_busid(self):
         """docstring for find_usb_busid"""
         pattern = 'usb (.*):.*idVendor={0}, idProduct={1}'.format(self._vid,
@@ -522,7 +1199,10 @@ class device(object):
         cmd = 'lthor --busid={0}'.format(busid)
         filenames = convert_single_item_to_list(filenames)
         for l in filenames:
-            cmd += ' {}'.format(l)
+            # wait for binaries which are still being downloaded. lthor
+            # needs the size of each file before the transfer starts, so
+            # images can't be streamed into it while they arrive.
+            cmd += ' {}'.format(l if isinstance(l, str) else l.wait())
         logging.debug(cmd)
         ret = call(cmd, shell=True, timeout=600)
         if ret:
@@ -550,12 +1230,7 @@ class device(object):
 
     def _heimdall(self, filenames, busaddr, devaddr, partition_bin_mappings):
         """docstring for _heimdall"""
-        filenames = convert_single_item_to_list(filenames)
-        tar_cmd = 'tar xvfz'
-        for l in filenames:
-            tar_cmd += ' {}'.format(l)
-        logging.debug(tar_cmd)
-        call(tar_cmd, shell=True, timeout=30)
+        imagecache().extract(filenames)
 
         heimdall_cmd = 'heimdall flash --usbbus {0}' \
                        ' --usbdevaddr {1}'.format(busaddr, devaddr)
@@ -578,6 +1253,7 @@ class device(object):
             if self._uart.inWaiting:
                 buf = self._read_uart(1000)
                 if find_pattern(self._pattern_loginprompt, data=buf):
+                    self._set_state(uart=True)
                     logging.debug('Found login shell pattern from uart log')
                     logging.debug('wait_time : {}'.format(wait_time))
                     return
@@ -663,6 +1339,7 @@ class device(object):
                 logging.debug(outs)
                 if find_pattern(pattern, outs):
                     logging.debug('found {}.'.format(self.get_id()))
+                    self._set_state(sdb=True)
                     return
                 time.sleep(0.2)
             retry_attempt += 1
@@ -683,8 +1360,10 @@ class device(object):
         """
         logging.debug('=================sdb root on for {}=================='
                       .format(self.get_name()))
-        call('sdb -s {} root on'.format(self.get_id()).split(), timeout=10)
+        ret = call('sdb -s {} root on'.format(self.get_id()).split(),
+                   timeout=10)
         time.sleep(0.5)
+        self._set_state(root=not ret)
 
     def _acquire_global_lock(self):
         """docstring for _acquire_global_lock"""
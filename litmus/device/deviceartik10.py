@@ -83,6 +83,8 @@ class deviceartik10(device):
     def _reboot(self):
         """docstring for _reboot"""
         status = self._current_uart_status()
+        self._device_info = None
+        self._set_state(sdb=False, root=False)
 
         if status == 'LOGGED_IN':
             self._write_uart(b'reboot')
@@ -139,6 +141,8 @@ class deviceartik10(device):
                 self._set_sdb_deviceid()
                 self._attach_sdb()
                 self.sdb_root_on()
+                self._load_device_info()
+                self._set_state(power=True)
                 return
             except KeyboardInterrupt:
                 raise Exception('Keyboard interrupt.')
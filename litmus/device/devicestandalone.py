@@ -32,10 +32,9 @@ class devicestandalone(device):
         self.args = args
         self.kwargs = kwargs
         self._name = kwargs['devicename']
-        if 'serialno' in kwargs:
-            self._id = kwargs['serialno']
-        else:
-            self._id = self._find_device_id()
+        # serialno is written by litmus gt. Without it, the id is found
+        # from sdb when it is used first.
+        self._id = kwargs.get('serialno')
 
         if 'usbid' in kwargs:
             self._usbid = kwargs['usbid']
@@ -71,6 +70,8 @@ class devicestandalone(device):
 
         :returns str: device id
         """
+        if self._id is None:
+            self._id = self._find_device_id()
         return self._id
 
     def on(self, booting_time=None):
@@ -86,6 +87,8 @@ class devicestandalone(device):
         if self.is_on():
             self.sdb_root_on()
             self.run_cmd('reboot -f', timeout=20)
+        self._device_info = None
+        self._set_state(sdb=False, root=False)
         wait_for_boot = booting_time if booting_time else self._booting_time
         for loop in range(wait_for_boot):
             logging.debug('Wait {} seconds......'
@@ -93,6 +96,9 @@ class devicestandalone(device):
             time.sleep(1)
         self.start_sdb_server()
         self.sdb_root_on()
+        self._load_device_info()
+        # sdb is unknown unless device info could be read over it
+        self._set_state(power=True, sdb=True if self._device_info else None)
 
     def off(self, powercut_delay=2):
         """
@@ -134,6 +140,8 @@ class devicestandalone(device):
             self.sdb_root_on()
             self._acquire_global_lock()
             self.run_cmd('reboot -f download', timeout=20)
+            self._device_info = None
+            self._set_state(sdb=False, root=False)
             time.sleep(waiting)
             if flasher == 'lthor':
                 if self._usbid is None:
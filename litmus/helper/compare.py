@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+# Copyright 2015-2016 Samsung Electronics Co., Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import logging
+import numpy
+from PIL import Image, ImageChops
+
+_ssim_c1 = (0.01 * 255) ** 2
+_ssim_c2 = (0.03 * 255) ** 2
+
+
+def _open(image):
+    """docstring for _open"""
+    return Image.open(image) if isinstance(image, str) else image
+
+
+def _to_array(image):
+    """docstring for _to_array"""
+    return numpy.asarray(_open(image).convert('L'), dtype=numpy.float32)
+
+
+def _to_mask(mask, size):
+    """docstring for _to_mask"""
+    if mask is None:
+        return None
+    if isinstance(mask, (list, tuple)):
+        # list of boxes (left, upper, right, lower) to ignore
+        arr = numpy.ones((size[1], size[0]), dtype=bool)
+        for left, upper, right, lower in mask:
+            arr[upper:lower, left:right] = False
+        return arr
+    return numpy.asarray(_open(mask).convert('L')) > 0
+
+
+def dhash(image, hash_size=8):
+    """
+    Calculate a perceptual difference hash of an image.
+
+    :param Image image: PIL image or filename
+    :param int hash_size: hash has hash_size * hash_size bits
+
+    Example:
+        >>> from litmus.helper.compare import dhash
+        >>> dhash('screenshot.png')
+        17289316592382869760
+
+    :returns int: hash value
+    """
+    im = _open(image).convert('L').resize((hash_size + 1, hash_size),
+                                          Image.BILINEAR)
+    arr = numpy.asarray(im, dtype=numpy.int16)
+    bits = (arr[:, 1:] > arr[:, :-1]).flatten()
+    return int(''.join('1' if b else '0' for b in bits), 2)
+
+
+def hamming_distance(hash1, hash2):
+    """
+    Return the number of different bits of two hashes.
+
+    :param int hash1: hash value
+    :param int hash2: hash value
+
+    :returns int: hamming distance
+    """
+    return bin(hash1 ^ hash2).count('1')
+
+
+def ssim(image, reference, mask=None, window=8):
+    """
+    Calculate a structural similarity index of two images.
+
+    SSIM is evaluated on non-overlapping window x window blocks of the
+    grayscale images and averaged. Blocks which are entirely masked out
+    are not counted. An image smaller than window is one block.
+
+    :param Image image: PIL image or filename
+    :param Image reference: PIL image or filename
+    :param mask: mask image (nonzero pixels are compared) or list of \
+            boxes (left, upper, right, lower) to ignore
+    :param int window: block size
+
+    :returns float: SSIM between -1.0 and 1.0. 1.0 means identical.
+    """
+    a = _to_array(image)
+    b = _to_array(reference)
+    if a.shape != b.shape:
+        raise Exception('Image sizes are different : {0} {1}'
+                        .format(a.shape, b.shape))
+    m = _to_mask(mask, (a.shape[1], a.shape[0]))
+    if m is not None:
+        # ignored pixels are taken from reference so that they never differ
+        a = numpy.where(m, a, b)
+
+    # images smaller than window are compared as a single block
+    wy = min(window, a.shape[0])
+    wx = min(window, a.shape[1])
+    h = a.shape[0] // wy * wy
+    w = a.shape[1] // wx * wx
+    shape = (h // wy, wy, w // wx, wx)
+    a = a[:h, :w].reshape(shape)
+    b = b[:h, :w].reshape(shape)
+
+    mu_a = a.mean(axis=(1, 3))
+    mu_b = b.mean(axis=(1, 3))
+    var_a = (a * a).mean(axis=(1, 3)) - mu_a * mu_a
+    var_b = (b * b).mean(axis=(1, 3)) - mu_b * mu_b
+    cov = (a * b).mean(axis=(1, 3)) - mu_a * mu_b
+    smap = (((2 * mu_a * mu_b + _ssim_c1) * (2 * cov + _ssim_c2)) /
+            ((mu_a * mu_a + mu_b * mu_b + _ssim_c1) *
+             (var_a + var_b + _ssim_c2)))
+
+    if m is not None:
+        valid = m[:h, :w].reshape(shape).any(axis=(1, 3))
+        if not valid.any():
+            return 1.0
+        return float(smap[valid].mean())
+    return float(smap.mean())
+
+
+def diff_ratio(image, reference, mask=None, tolerance=16):
+    """
+    Return the ratio of pixels which differ more than tolerance.
+
+    :param Image image: PIL image or filename
+    :param Image reference: PIL image or filename
+    :param mask: mask image (nonzero pixels are compared) or list of \
+            boxes (left, upper, right, lower) to ignore
+    :param int tolerance: max allowed difference of a pixel value
+
+    :returns float: ratio of different pixels between 0.0 and 1.0
+    """
+    a = _open(image).convert('RGB')
+    b = _open(reference).convert('RGB')
+    if a.size != b.size:
+        raise Exception('Image sizes are different : {0} {1}'
+                        .format(a.size, b.size))
+    diff = numpy.asarray(ImageChops.difference(a, b)).max(axis=2)
+    diff = diff > tolerance
+    m = _to_mask(mask, a.size)
+    if m is not None:
+        total = int(m.sum())
+        return float((diff & m).sum()) / total if total else 0.0
+    return float(diff.mean())
+
+
+def compare_images(image, reference, mask=None, max_distance=10,
+                   min_ssim=0.95, max_diff_ratio=0.01, tolerance=16):
+    """
+    Compare an image with a reference image.
+
+    Perceptual hashes are compared first to reject very different images
+    quickly. Then masked SSIM and pixel difference are calculated.
+
+    :param Image image: PIL image or filename
+    :param Image reference: PIL image or filename
+    :param mask: mask image (nonzero pixels are compared) or list of \
+            boxes (left, upper, right, lower) to ignore
+    :param int max_distance: max hamming distance of perceptual hashes
+    :param float min_ssim: min SSIM to regard images as same
+    :param float max_diff_ratio: max ratio of different pixels
+    :param int tolerance: max allowed difference of a pixel value
+
+    Example:
+        >>> from litmus.helper.compare import compare_images
+        >>> dut.screenshot('home.png')
+        >>> compare_images('home.png', 'reference/home.png',
+                           mask=[(0, 0, 720, 48)])
+        {'same': True, 'distance': 0, 'ssim': 0.998, 'diff_ratio': 0.0}
+
+    :returns dict: comparison result
+    """
+    image = _open(image)
+    reference = _open(reference)
+    result = {'same': False, 'distance': None, 'ssim': None,
+              'diff_ratio': None}
+
+    if image.size != reference.size:
+        logging.debug('size mismatch : {0} {1}'.format(image.size,
+                                                       reference.size))
+        return result
+
+    image = image.convert('RGB')
+    reference = reference.convert('RGB')
+    # masked area has to be ignored by hash as well
+    if mask is not None:
+        m = _to_mask(mask, image.size).astype(numpy.uint8) * 255
+        image = Image.composite(image, reference, Image.fromarray(m))
+
+    # identical images are the most common case. It is checked in C.
+    if ImageChops.difference(image, reference).getbbox() is None:
+        result.update({'same': True, 'distance': 0, 'ssim': 1.0,
+                       'diff_ratio': 0.0})
+        return result
+
+    result['distance'] = hamming_distance(dhash(image), dhash(reference))
+    if result['distance'] > max_distance:
+        return result
+
+    result['ssim'] = ssim(image, reference, mask=mask)
+    result['diff_ratio'] = diff_ratio(image, reference, mask=mask,
+                                      tolerance=tolerance)
+    result['same'] = (result['ssim'] >= min_ssim and
+                      result['diff_ratio'] <= max_diff_ratio)
+    return result
+
+
+class reference_store(object):
+    """
+    Reference images for visual verification.
+
+    Images are stored under path/<dev_type>/<width>x<height>/<name>.png so
+    that each device type and screen size has its own references.
+    Decoded references and their hashes are cached in memory.
+    """
+
+    def __init__(self, path):
+        """
+        :param str path: root directory of reference images
+        """
+        super(reference_store, self).__init__()
+        self._path = os.path.abspath(path)
+        self._cache = {}
+
+    def get_path(self, dut, name):
+        """
+        Return the path of a reference image for device.
+
+        :param device dut: device instance
+        :param str name: reference name
+
+        :returns str: reference image path
+        """
+        return os.path.join(self._path,
+                            dut.kwargs['dev_type'],
+                            '{0}x{1}'.format(dut._screen_width,
+                                             dut._screen_height),
+                            '{}.png'.format(name))
+
+    def put(self, dut, name, image):
+        """
+        Save an image as a reference.
+
+        :param device dut: device instance
+        :param str name: reference name
+        :param Image image: PIL image or filename
+        """
+        path = self.get_path(dut, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _open(image).save(path)
+        self._cache.pop(path, None)
+
+    def get(self, dut, name):
+        """
+        Load a reference image.
+
+        :param device dut: device instance
+        :param str name: reference name
+
+        :returns Image: reference image or None if it does not exist
+        """
+        path = self.get_path(dut, name)
+        if path not in self._cache:
+            if not os.path.exists(path):
+                return None
+            im = Image.open(path)
+            im.load()
+            self._cache[path] = im
+        return self._cache[path]
+
+    def compare(self, dut, name, image, **kwargs):
+        """
+        Compare an image with the reference of device.
+
+        Keyword arguments are passed to compare_images().
+
+        Example:
+            >>> from litmus.helper.compare import reference_store
+            >>> refs = reference_store('reference')
+            >>> dut.screenshot('home.png')
+            >>> refs.compare(dut, 'home', 'home.png')['same']
+            True
+
+        :param device dut: device instance
+        :param str name: reference name
+        :param Image image: PIL image or filename
+
+        :returns dict: comparison result
+        """
+        reference = self.get(dut, name)
+        if reference is None:
+            raise Exception('There\'s no reference image : {}'
+                            .format(self.get_path(dut, name)))
+        return compare_images(image, reference, **kwargs)
@@ -13,15 +13,20 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
+import re
 import time
 import serial
 import logging
-from threading import Thread
+import fasteners
+from threading import Thread, Event
+from concurrent.futures import ThreadPoolExecutor
 from configparser import RawConfigParser
-from litmus import _duts_
-from litmus.core.util import check_output, find_pattern, decode
+from litmus import _duts_, _path_for_locks_
+from litmus.core.util import call, check_output, find_pattern, decode
 from litmus.device.cuttercleware4 import cuttercleware4
 from litmus.device.cuttersmartpower import cuttersmartpower
+from litmus.device.cuttergroup import cuttergroup
 
 
 class generate_topology_sdb_device(object):
@@ -45,6 +50,14 @@ class generate_topology_sdb_device(object):
     cleware4s = None
     topology_path = _duts_
     open_mode = 'w+'
+    incremental = False
+    kept = None
+    claimed = None
+    bootprompt_wait = 4
+    expect_timeout = 2.0
+    probe_timeout = 0.5
+    max_workers = 32
+    pattern_prompt = r'\n[^\n]*#\s*$'
 
     def __init__(self, *args, **kwargs):
         super(generate_topology_sdb_device, self).__init__()
@@ -52,6 +65,10 @@ class generate_topology_sdb_device(object):
             self.open_mode = 'a+'
         if 'topology' in kwargs and kwargs['topology']:
             self.topology_path = kwargs['topology']
+        if 'incremental' in kwargs and kwargs['incremental']:
+            self.incremental = True
+        self.kept = RawConfigParser()
+        self.claimed = set()
 
     def init_smartpowers(self):
         """docstring for init_smartpowers"""
@@ -80,6 +97,8 @@ class generate_topology_sdb_device(object):
         smartpower_names = find_smartpower_names()
         self.smartpowers = []
         for l in smartpower_names:
+            if ('smartpower', l) in self.claimed:
+                continue
             obj = {'dev_id': '',
                    'cutter_type': 'smartpower',
                    'cutter_port': l
@@ -91,9 +110,9 @@ class generate_topology_sdb_device(object):
         def find_cleware4_names():
             """docstring for find_cleware4s"""
             p = '.*Switch1.*version:.(29|512),.*serial number:.([0-9]{6,7})'
+            out = check_output('clewarecontrol -l', shell=True) or ''
             cleware4s = [find_pattern(p, s, groupindex=2)
-                         for s in check_output('clewarecontrol -l',
-                                               shell=True).split('\n')
+                         for s in out.split('\n')
                          if find_pattern(p, s)]
             logging.debug('cleware4 cutters : {0}'.format(cleware4s))
             return cleware4s
@@ -102,6 +121,8 @@ class generate_topology_sdb_device(object):
         self.cleware4s = []
         for l in cleware4_names:
             for idx in range(0, 4):
+                if ('cleware4', l, str(idx)) in self.claimed:
+                    continue
                 obj = {'dev_id': '',
                        'cutter_type': 'cleware4',
                        'cutter_port': l,
@@ -122,7 +143,8 @@ class generate_topology_sdb_device(object):
             if out:
                 return out.split()
             else:
-                raise Exception('There\'s no /dev/ttyUSB for duts.')
+                logging.debug('There\'s no /dev/ttyUSB for duts.')
+                return []
 
         def find_uart_names():
             """docstring for find_uarts"""
@@ -133,7 +155,8 @@ class generate_topology_sdb_device(object):
             return uarts
 
         self.uarts = []
-        uart_names = find_uart_names()
+        uart_names = [l for l in find_uart_names()
+                      if ('uart', l) not in self.claimed]
         for l in uart_names:
             uart = serial.Serial(port=l, baudrate=115200, timeout=0.5)
             init_jig(uart)
@@ -144,29 +167,32 @@ class generate_topology_sdb_device(object):
         for l in self.uarts:
             l.close()
 
-    def enter_boot_prompt(self, uart, cnt):
+    def enter_boot_prompt(self, uart, stop):
         """docstring for enter_boot_command"""
-        for l in range(cnt):
+        while not stop.is_set():
             uart.write(b'\r')
             time.sleep(0.025)
 
-    def enter_bootloader_prompt_mode(self):
+    def enter_bootloader_prompt_mode(self, cutters=None):
         """docstring for enter_bootloader_prompt"""
+        if cutters is None:
+            cutters = self.smartpowers + self.cleware4s
 
         # create threads for entering bootloader prompt
-        delay = (5 + (len(self.cleware4s) * 2 * 4 +
-                 len(self.smartpowers) * 2 * 2)) * 30
-
+        stop = Event()
         threads = []
         for l in self.uarts:
 
-            t = Thread(target=self.enter_boot_prompt, args=(l, delay))
+            t = Thread(target=self.enter_boot_prompt, args=(l, stop))
             t.start()
             threads.append(t)
 
-        # turn on duts
-        self.turn_on_smartpowers()
-        self.turn_on_cleware4s()
+        # turn on all duts at once
+        try:
+            self.turn_on(cutters)
+            time.sleep(self.bootprompt_wait)
+        finally:
+            stop.set()
 
         # join all threads
         for l in threads:
@@ -175,14 +201,11 @@ class generate_topology_sdb_device(object):
 
     def turn_on(self, cutters):
         """docstring for turn_on"""
-        for l in cutters:
-            l.off(0.5)
-            l.on(0.5)
+        cuttergroup(cutters).power_cycle(off_delay=0.5, on_delay=0.5)
 
     def turn_off(self, cutters):
         """docstring for turn_off"""
-        for l in cutters:
-            l.off(0.5)
+        cuttergroup(cutters).off(0.5)
 
     def turn_on_smartpowers(self):
         """docstring for turn_on_smartpowers"""
@@ -200,91 +223,183 @@ class generate_topology_sdb_device(object):
         """docstring for turn_off_cleware4"""
         self.turn_off(self.cleware4s)
 
+    def expect(self, uart, pattern, timeout=None):
+        """docstring for expect"""
+        timeout = timeout if timeout else self.expect_timeout
+        deadline = time.perf_counter() + timeout
+        buf = b''
+        while time.perf_counter() < deadline:
+            buf += uart.read(uart.inWaiting() or 1)
+            data = decode(buf)
+            if find_pattern(pattern, data):
+                return True, data
+            # reply is over when the next prompt is shown
+            if find_pattern(self.pattern_prompt, data):
+                return False, data
+        return False, decode(buf)
+
     def recognize_device(self, config, uart):
         """docstring for recognize_device"""
         for l in self.devcatalog:
-            logging.debug('Is {}'.format(l['dev_type'].upper()))
+            logging.debug('Is {} : {}'.format(l['dev_type'].upper(),
+                                              uart.name))
             uart.flushInput()
-            time.sleep(0.1)
-            uart.flushOutput()
-            time.sleep(0.5)
+            uart.write(l['cmd'].encode() + b'\r')
             uart.flush()
-            time.sleep(0.1)
 
-            uart.write(l['cmd'].encode() + b'\r')
-            time.sleep(0.5)
-
-            buf = uart.read(5000)
-            if find_pattern(l['pattern'], decode(buf)):
-                logging.debug('Yes')
-                name = '{0}_{1:0>3}'.format(l['dev_type'].upper(),
-                                            l['index'])
-                cfg = {'name': name,
-                       'dev_type': l['dev_type'],
+            found, buf = self.expect(uart, l['pattern'])
+            if found:
+                logging.debug('Yes : {}'.format(uart.name))
+                cfg = {'dev_type': l['dev_type'],
                        'uart_port': uart.name
                        }
-                l['index'] += 1
                 return cfg
 
+    def recognize_devices(self, config):
+        """docstring for recognize_devices"""
+        if not self.uarts:
+            return []
+        workers = min(self.max_workers, len(self.uarts))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(
+                lambda uart: self.recognize_device(config, uart),
+                self.uarts))
+
+        # name devices in order of uarts
+        cfgs = []
+        for uart, cfg in zip(self.uarts, results):
+            if not cfg:
+                uart.close()
+                continue
+            catalog = [l for l in self.devcatalog
+                       if l['dev_type'] == cfg['dev_type']][0]
+            cfg['name'] = '{0}_{1:0>3}'.format(cfg['dev_type'].upper(),
+                                               catalog['index'])
+            catalog['index'] += 1
+            cfgs.append(cfg)
+        return cfgs
+
     def is_on(self, uart):
         """docstring for is_on"""
-        p = r'.*echo.*'
         uart.flushInput()
-        time.sleep(0.1)
-        uart.flushOutput()
-        time.sleep(0.1)
-        uart.flush()
-        time.sleep(0.1)
         uart.write(b'echo\r')
-        time.sleep(0.1)
-        data = decode(b' '.join(uart.readlines(500)))
-        return find_pattern(p, data)
+        uart.flush()
+        found, data = self.expect(uart, r'echo', timeout=self.probe_timeout)
+        return found
+
+    def probe_uarts(self):
+        """docstring for probe_uarts"""
+        if not self.uarts:
+            return []
+        workers = min(self.max_workers, len(self.uarts))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(self.is_on, self.uarts))
+
+    def map_cutters(self, cutters):
+        """docstring for map_cutters"""
+        # cutter i has code i+1. In round b, cutters whose code has bit b
+        # are turned off and all uarts are probed at once. Every bit is
+        # sent twice, as is and inverted, so a uart has to be silent in
+        # exactly one of the two rounds of each bit. A flaky probe or a
+        # dead board breaks that and the uart is probed sequentially.
+        codes = dict((idx + 1, l) for idx, l in enumerate(cutters))
+        nbits = len(cutters).bit_length()
+        mask = (1 << nbits) - 1
+        signatures = dict((l.name, [0, 0]) for l in self.uarts)
+        turned_off = []
+
+        def _probe(to_off):
+            """docstring for _probe"""
+            nonlocal turned_off
+            to_on = [l for l in turned_off if l not in to_off]
+            if to_on:
+                self.enter_bootloader_prompt_mode(to_on)
+            if to_off:
+                self.turn_off(to_off)
+            turned_off = to_off
+            return dict((uart.name, on)
+                        for uart, on in zip(self.uarts, self.probe_uarts()))
+
+        for inverted in (0, 1):
+            for bit in range(nbits):
+                logging.debug('[Mapping round {0}{1}]'
+                              .format(bit, ' inverted' if inverted else ''))
+                to_off = [l for code, l in codes.items()
+                          if (code >> bit & 1) != inverted]
+                for name, on in _probe(to_off).items():
+                    if not on:
+                        signatures[name][inverted] |= 1 << bit
+
+        mapping = {}
+        for name, (code, inverse) in signatures.items():
+            if code ^ inverse == mask and code in codes:
+                mapping[name] = codes[code]
+            else:
+                logging.debug('Can\'t decode cutter of {0} : {1:b} {2:b}'
+                              .format(name, code, inverse))
+
+        # a cutter can't power two uarts
+        for l in cutters:
+            names = [k for k, v in mapping.items() if v is l]
+            if len(names) > 1:
+                logging.debug('{0} is decoded for {1}'.format(l._cport, names))
+                for name in names:
+                    mapping.pop(name)
+
+        ambiguous = [l.name for l in self.uarts if l.name not in mapping]
+        if ambiguous:
+            logging.debug('[Mapping sequentially : {}]'.format(ambiguous))
+            # uarts which don't answer with all cutters on can't be mapped
+            alive = _probe([])
+            ambiguous = [l for l in ambiguous if alive[l]]
+            for l in cutters:
+                if not ambiguous:
+                    break
+                if l in mapping.values():
+                    continue
+                silent = [k for k, on in _probe([l]).items()
+                          if not on and k in ambiguous]
+                if len(silent) == 1:
+                    mapping[silent[0]] = l
+                    ambiguous.remove(silent[0])
+                elif silent:
+                    logging.debug('{0} is found for {1}'
+                                  .format(l._cport, silent))
+            for name in ambiguous:
+                logging.debug('Can\'t find cutter of {}'.format(name))
+        return mapping
 
     def generate_device_topology(self):
         """docstring for generate_device_topology"""
 
-        # open config parser
-        config = RawConfigParser()
-        cfgs = []
+        # open config parser. unchanged devices are kept as they are
+        config = self.kept
 
-        # recognize device type
-        for l in self.uarts:
-            logging.debug('[Recognize device type for uart : '
-                          '{}]'.format(l.name))
-            cfg = self.recognize_device(config, l)
-            if cfg:
-                cfgs.append(cfg)
-            else:
-                l.close()
+        # recognize device type of all uarts concurrently
+        logging.debug('[Recognize device types]')
+        cfgs = self.recognize_devices(config)
 
         # remove closed uart obj
         self.uarts = [m for m in self.uarts if m.isOpen()]
 
         logging.debug('[Generate topology configurations]')
-        for l in self.smartpowers:
-            l.off()
-            for l_uart in self.uarts:
-                if not self.is_on(l_uart):
-                    dev = [m for m in cfgs if m['uart_port'] == l_uart.name][0]
-                    dev['cutter_type'] = 'smartpower'
-                    dev['cutter_port'] = l._cport
-                    l_uart.close()
-                    self.uarts.remove(l_uart)
-                    logging.debug(dev)
-                    break
-
-        for l in self.cleware4s:
-            l.off()
-            for l_uart in self.uarts:
-                if not self.is_on(l_uart):
-                    dev = [m for m in cfgs if m['uart_port'] == l_uart.name][0]
-                    dev['cutter_type'] = 'cleware4'
-                    dev['cutter_port'] = l._cport
-                    dev['cleware_index'] = l._cindex
-                    l_uart.close()
-                    self.uarts.remove(l_uart)
-                    logging.debug(dev)
-                    break
+        mapping = self.map_cutters(self.smartpowers + self.cleware4s) \
+            if cfgs else {}
+        for dev in cfgs:
+            l = mapping.get(dev['uart_port'])
+            if l is None:
+                continue
+            dev['cutter_type'] = l._ctype
+            dev['cutter_port'] = l._cport
+            if l._ctype == 'cleware4':
+                dev['cleware_index'] = l._cindex
+            elif l._ctype == 'smartpower':
+                dev['cutter_path'], dev['cutter_serial'] = \
+                    fingerprint(l._cport)
+            logging.debug(dev)
+        for dev in cfgs:
+            dev['uart_path'], dev['uart_serial'] = \
+                fingerprint(dev['uart_port'])
 
         for l in self.uarts:
             l.close()
@@ -294,40 +409,281 @@ class generate_topology_sdb_device(object):
             l.pop('name')
             config.add_section(section_name)
             for key in sorted(l.keys()):
-                config.set(section_name, key, str(l[key]))
+                if l[key] is not None:
+                    config.set(section_name, key, str(l[key]))
 
         with open(self.topology_path, self.open_mode) as f:
             config.write(f)
         logging.debug('Done.')
 
+    def keep_unchanged_devices(self):
+        """docstring for keep_unchanged_devices"""
+        config = RawConfigParser()
+        config.read(self.topology_path)
+        uarts = dict((fingerprint(l), l) for l in find_devnodes('tty'))
+        hidraws = dict((fingerprint(l), l) for l in find_devnodes('hidraw'))
+
+        for section in config.sections():
+            items = dict(config.items(section))
+            if 'uart_port' not in items:
+                # standalone devices are not probed by gt
+                self.kept[section] = items
+                continue
+
+            busy = not is_idle(section)
+            uart = uarts.get((items.get('uart_path'),
+                              items.get('uart_serial')))
+            cutter = True
+            if items.get('cutter_type') == 'smartpower':
+                cutter = hidraws.get((items.get('cutter_path'),
+                                      items.get('cutter_serial')))
+                items['cutter_port'] = cutter or items['cutter_port']
+            if busy or (uart and cutter and items.get('uart_path')):
+                # device nodes may be renumbered. follow the hardware.
+                items['uart_port'] = uart or items['uart_port']
+                logging.debug('Keep {0}{1}'.format(section,
+                                                   ' (busy)' if busy else ''))
+                self.kept[section] = items
+                self.claim(items)
+            else:
+                logging.debug('Probe {} again'.format(section))
+
+        # new devices are numbered after kept ones
+        for l in self.devcatalog:
+            prefix = l['dev_type'].upper() + '_'
+            indexes = [int(m[len(prefix):]) for m in self.kept.sections()
+                       if m.startswith(prefix) and m[len(prefix):].isdigit()]
+            l['index'] = max(indexes + [0]) + 1
+
+    def claim(self, items):
+        """docstring for claim"""
+        self.claimed.add(('uart', items['uart_port']))
+        if items.get('cutter_type') == 'cleware4':
+            self.claimed.add(('cleware4', items['cutter_port'],
+                              str(items['cleware_index'])))
+        elif items.get('cutter_type'):
+            self.claimed.add((items['cutter_type'], items['cutter_port']))
+
     def run(self):
         """docstring for run"""
+        if self.incremental and os.path.exists(self.topology_path):
+            self.keep_unchanged_devices()
+            self.open_mode = 'w+'
+
         # init peripherals
         self.init_smartpowers()
         self.init_cleware4s()
         self.open_uarts()
 
-        # enter bootloader prompt
-        self.enter_bootloader_prompt_mode()
+        # hosts with standalone devices only have nothing to probe
+        if self.uarts:
+            # enter bootloader prompt
+            self.enter_bootloader_prompt_mode()
 
         # generate cfg
         self.generate_device_topology()
 
-        # turn off duts
-        self.turn_off_smartpowers()
-        self.turn_off_cleware4s()
+        if self.uarts:
+            # turn off duts
+            self.turn_off(self.smartpowers + self.cleware4s)
 
         # close uarts
         self.close_uarts()
 
 
-def main(topology):
+class generate_topology_standalone_device(object):
+    """docstring for generate_topology_standalone_device"""
+
+    devcatalog = [
+        {'dev_type': 'standalone_tm1',
+         'pattern': r'(?i).*\btm1\b.*',
+         'index': 1
+         },
+        {'dev_type': 'standalone_tm2',
+         'pattern': r'(?i).*\btm2\b.*',
+         'index': 1
+         },
+        {'dev_type': 'standalone_tw1',
+         'pattern': r'(?i).*\btw1\b.*',
+         'index': 1
+         },
+        {'dev_type': 'standalone_u3',
+         'pattern': r'(?i).*odroid-?u3.*',
+         'index': 1
+         },
+        {'dev_type': 'standalone_xu3',
+         'pattern': r'(?i).*odroid-?xu3.*',
+         'index': 1
+         },
+        ]
+
+    model_cmd = 'cat /proc/device-tree/model /etc/info.ini 2>/dev/null'
+    pattern_device = r'(?m)^(\S+)\s+device\b(.*)$'
+    topology_path = _duts_
+    max_workers = 16
+
+    def __init__(self, *args, **kwargs):
+        super(generate_topology_standalone_device, self).__init__()
+        if 'topology' in kwargs and kwargs['topology']:
+            self.topology_path = kwargs['topology']
+
+    def find_devices(self):
+        """docstring for find_devices"""
+        call('sdb start-server', shell=True, timeout=10)
+        outs = check_output(['sdb', 'devices'], timeout=10) or ''
+        devices = [(m.group(1), m.group(2).strip())
+                   for m in re.finditer(self.pattern_device, outs)]
+        logging.debug('sdb devices : {}'.format(devices))
+        return devices
+
+    def recognize_device(self, serialno, name):
+        """docstring for recognize_device"""
+        outs = check_output(['sdb', '-s', serialno, 'shell',
+                             self.model_cmd], timeout=10) or ''
+        model = '{0}\n{1}'.format(name, outs)
+        for l in self.devcatalog:
+            if find_pattern(l['pattern'], model):
+                logging.debug('{0} is {1}'.format(serialno, l['dev_type']))
+                return l['dev_type']
+        logging.debug('Unknown model of {0} : {1}'.format(serialno, model))
+
+    def run(self):
+        """docstring for run"""
+        config = RawConfigParser()
+        config.read(self.topology_path)
+        # devices in topology use serialno or section name as sdb id
+        known = set(config.get(l, 'serialno', fallback=l)
+                    for l in config.sections())
+
+        devices = [l for l in self.find_devices() if l[0] not in known]
+        if not devices:
+            logging.debug('There\'s no new standalone device.')
+            return
+        workers = min(self.max_workers, len(devices))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            dev_types = list(executor.map(
+                lambda l: self.recognize_device(*l), devices))
+
+        usbids = find_usb_serials()
+        for (serialno, name), dev_type in zip(devices, dev_types):
+            if not dev_type:
+                continue
+            catalog = [l for l in self.devcatalog
+                       if l['dev_type'] == dev_type][0]
+            prefix = dev_type.split('_', 1)[1].upper()
+            while True:
+                section = '{0}_{1:0>3}'.format(prefix, catalog['index'])
+                catalog['index'] += 1
+                if not config.has_section(section):
+                    break
+            config.add_section(section)
+            config.set(section, 'dev_type', dev_type)
+            config.set(section, 'serialno', serialno)
+            if serialno in usbids:
+                config.set(section, 'usbid', usbids[serialno])
+            logging.debug('{0} : {1}'.format(section, dict(config[section])))
+
+        with open(self.topology_path, 'w+') as f:
+            config.write(f)
+        logging.debug('Done.')
+
+
+def find_usb_serials():
+    """docstring for find_usb_serials"""
+    path = '/sys/bus/usb/devices'
+    usbids = {}
+    try:
+        names = os.listdir(path)
+    except OSError:
+        return usbids
+    for l in names:
+        try:
+            with open(os.path.join(path, l, 'serial')) as f:
+                usbids[f.read().strip()] = l
+        except OSError:
+            pass
+    return usbids
+
+
+def find_devnodes(subsystem):
+    """docstring for find_devnodes"""
+    path = os.path.join('/sys/class', subsystem)
+    try:
+        return ['/dev/{}'.format(l) for l in sorted(os.listdir(path))]
+    except OSError:
+        return []
+
+
+def fingerprint(devnode):
+    """docstring for fingerprint"""
+    name = os.path.basename(devnode)
+    by_path = '/dev/serial/by-path'
+    usb_path = None
+    usb_serial = None
+
+    # usb device which the node belongs to has idVendor
+    for subsystem in ('tty', 'hidraw'):
+        path = os.path.join('/sys/class', subsystem, name, 'device')
+        if os.path.exists(path):
+            path = os.path.realpath(path)
+            while path != '/':
+                if os.path.exists(os.path.join(path, 'idVendor')):
+                    usb_path = os.path.basename(path)
+                    try:
+                        with open(os.path.join(path, 'serial')) as f:
+                            usb_serial = f.read().strip()
+                    except OSError:
+                        pass
+                    break
+                path = os.path.dirname(path)
+            break
+
+    # /dev/serial/by-path is preferred for uarts
+    if os.path.isdir(by_path):
+        for l in os.listdir(by_path):
+            if os.path.realpath(os.path.join(by_path, l)) == \
+                    os.path.realpath(devnode):
+                usb_path = l
+                break
+    return usb_path, usb_serial
+
+
+def is_idle(devicename):
+    """docstring for is_idle"""
+    ilock = fasteners.InterProcessLock(os.path.join(_path_for_locks_,
+                                                    devicename))
+    try:
+        if ilock.acquire(blocking=False):
+            ilock.release()
+            return True
+    except Exception as e:
+        logging.debug(e)
+    return False
+
+
+def main(topology, incremental=False):
     """docstring for main"""
     try:
 
         logging.debug('# phase 1 : detect all devices which use sdb')
-        phase_sdb = generate_topology_sdb_device(topology=topology)
-        phase_sdb.run()
+        failure = None
+        try:
+            phase_sdb = generate_topology_sdb_device(topology=topology,
+                                                     incremental=incremental)
+            phase_sdb.run()
+        except KeyboardInterrupt:
+            raise
+        except Exception as e:
+            logging.debug(e)
+            failure = e
+
+        logging.debug('# phase 2 : detect all standalone devices')
+        phase_standalone = generate_topology_standalone_device(
+            topology=topology)
+        phase_standalone.run()
+
+        if failure:
+            raise failure
 
     except KeyboardInterrupt:
         raise Exception('Keyboard Interrupt')
@@ -17,11 +17,13 @@ import re
 import sys
 import time
 import shutil
+import hashlib
 import logging
 import requests
 import tempfile
 import urllib.parse
 from subprocess import DEVNULL
+from threading import Thread, Condition
 from bs4 import BeautifulSoup
 from litmus.core.util import find_pattern, find_all_pattern
 from litmus.core.util import call
@@ -34,7 +36,8 @@ def tizen_snapshot_downloader(url, pattern_bin='tar.gz$',
                               version=None,
                               timeout=10,
                               maxretry=20,
-                              waiting_for_retry=10):
+                              waiting_for_retry=10,
+                              background=False):
     """
     Download snapshot images from web server.
 
@@ -50,14 +53,23 @@ def tizen_snapshot_downloader(url, pattern_bin='tar.gz$',
     :param float timeout: timeout
     :param int maxretry: max retry count to attempt the url for downloading
     :param float waiting_for_retry: delay for each retry
+    :param bool background: return immediately and download binaries in \
+            background threads. dut.flash() accepts the returned objects. \
+            Downloads overlap entering download mode (and extraction for \
+            heimdall), but not the USB transfer: lthor and heimdall start \
+            only after all binaries have been downloaded.
 
     Example:
         >>> from litmus.helper.helper import tizen_snapshot_downloader
         >>> tizen_snapshot_downloader(
                 url='http://download.tizen.org/snapshots/tizen/tv/latest/images/arm-wayland/tv-wayland-armv7l-odroidu3/')
         [\'tizen-tv_20160516.2_tv-wayland-armv7l-odroidu3.tar.gz\']
+        >>> or
+        >>> filenames = tizen_snapshot_downloader(url=url, background=True)
+        >>> dut.flash(filenames)
 
-    :returns list: filenames of downloaded binaries
+    :returns list: filenames of downloaded binaries or background_download \
+            instances if background is True
 
     """
     logging.debug('============Download binaries from server===========')
@@ -99,6 +111,8 @@ def tizen_snapshot_downloader(url, pattern_bin='tar.gz$',
                 continue
             soup = BeautifulSoup(f.text, 'html.parser')
             filenames = []
+            if background:
+                md5sums = _get_md5sums(url, username, password, timeout)
 
             for l in soup.findAll('a',
                                   attrs={'href': re.compile(pattern_bin)}):
@@ -106,6 +120,16 @@ def tizen_snapshot_downloader(url, pattern_bin='tar.gz$',
                 fileurl = urllib.parse.urljoin(url, filename)
                 logging.debug(fileurl)
 
+                if background:
+                    filenames.append(background_download(
+                        fileurl, filename,
+                        username=username, password=password,
+                        timeout=timeout,
+                        md5sums=md5sums,
+                        maxretry=maxretry,
+                        waiting_for_retry=waiting_for_retry))
+                    continue
+
                 with open(filename, 'wb') as f:
                     logging.debug('Downloading {}'.format(filename))
                     resp = requests.get(fileurl,
@@ -151,6 +175,167 @@ def tizen_snapshot_downloader(url, pattern_bin='tar.gz$',
     return filenames
 
 
+def _get_md5sums(url, username, password, timeout):
+    """docstring for _get_md5sums"""
+    try:
+        f = requests.get(urllib.parse.urljoin(url, 'MD5SUMS'),
+                         auth=(username, password), timeout=timeout)
+    except requests.exceptions.RequestException as e:
+        logging.debug(e)
+        return {}
+    if f.status_code != 200:
+        return {}
+    return {name.lstrip('*'): md5 for md5, name
+            in find_all_pattern(r'([0-9a-f]{32})\s+(\S+)', f.text)}
+
+
+class background_download(object):
+    """
+    Download a binary in a background thread.
+
+    Data is written to filename as it arrives. The flasher can read the
+    binary by open() while downloading is still in progress, and wait()
+    blocks until the whole binary has been downloaded and verified.
+    """
+
+    _chunk_size = 1024 * 1024
+
+    def __init__(self, url, filename, username='', password='', timeout=10,
+                 md5sums=None, maxretry=20, waiting_for_retry=10):
+        super(background_download, self).__init__()
+        self.url = url
+        self.filename = filename
+        self._auth = (username, password)
+        self._timeout = timeout
+        self._maxretry = maxretry
+        self._waiting_for_retry = waiting_for_retry
+        self._md5 = md5sums.get(filename) if md5sums else None
+        self._size = 0
+        self._done = False
+        self._error = None
+        self._cond = Condition()
+        # create the file before the thread starts so that readers never
+        # see a missing file.
+        open(self.filename, 'wb').close()
+        self._thread = Thread(target=self._download, daemon=True)
+        self._thread.start()
+
+    def __str__(self):
+        return self.filename
+
+    def __repr__(self):
+        return self.filename
+
+    def wait(self):
+        """
+        Wait until downloading has finished.
+
+        :returns str: filename of downloaded binary
+        """
+        with self._cond:
+            while not self._done:
+                self._cond.wait()
+        if self._error:
+            raise Exception('Can\'t download {0} : {1}'.format(self.url,
+                                                                self._error))
+        return self.filename
+
+    def open(self):
+        """
+        Open the binary as a file object which blocks until data arrives.
+        """
+        return _growing_file(self)
+
+    def _download(self):
+        """docstring for _download"""
+        logging.debug('Downloading {} in background'.format(self.filename))
+        h = hashlib.md5()
+        try:
+            for loop in range(self._maxretry):
+                try:
+                    total_length = self._fetch(h)
+                    break
+                except (requests.exceptions.Timeout,
+                        requests.exceptions.ConnectionError,
+                        requests.exceptions.ChunkedEncodingError) as e:
+                    logging.debug('Resume {0} from {1} : {2}'
+                                  .format(self.filename, self._size, e))
+                    time.sleep(self._waiting_for_retry)
+            else:
+                raise Exception('Can\'t open url {0}'.format(self.url))
+            if total_length is not None and int(total_length) != self._size:
+                raise Exception('size mismatch {0} != {1}'
+                                .format(self._size, total_length))
+            if self._md5 and self._md5 != h.hexdigest():
+                raise Exception('md5sum mismatch')
+            logging.debug('Downloaded {}'.format(self.filename))
+        except Exception as e:
+            logging.debug(e)
+            self._error = e
+        finally:
+            with self._cond:
+                self._done = True
+                self._cond.notify_all()
+
+    def _fetch(self, h):
+        """docstring for _fetch"""
+        headers = {}
+        if self._size:
+            headers['Range'] = 'bytes={}-'.format(self._size)
+        resp = requests.get(self.url, auth=self._auth, stream=True,
+                            headers=headers, timeout=self._timeout)
+        resp.raise_for_status()
+        if resp.status_code == 206:
+            total_length = find_pattern(r'/([0-9]+)$',
+                                        resp.headers.get('Content-Range', ''),
+                                        groupindex=1)
+            skip = 0
+        else:
+            # server ignored the range. skip the data we already have.
+            total_length = resp.headers.get('Content-Length')
+            skip = self._size
+        with open(self.filename, 'ab') as f:
+            for data in resp.iter_content(chunk_size=self._chunk_size):
+                if skip:
+                    data, skip = data[skip:], max(0, skip - len(data))
+                    if not data:
+                        continue
+                f.write(data)
+                f.flush()
+                h.update(data)
+                with self._cond:
+                    self._size += len(data)
+                    self._cond.notify_all()
+        return total_length
+
+
+class _growing_file(object):
+    """docstring for _growing_file"""
+
+    def __init__(self, download):
+        self._download = download
+        self._f = open(download.filename, 'rb')
+        self._pos = 0
+
+    def read(self, size=-1):
+        """docstring for read"""
+        d = self._download
+        with d._cond:
+            while not d._done and (size < 0 or d._size - self._pos < size):
+                d._cond.wait()
+            if d._error:
+                raise IOError('Can\'t download {0} : {1}'.format(d.url,
+                                                                  d._error))
+            available = d._size - self._pos
+        data = self._f.read(available if size < 0 else min(size, available))
+        self._pos += len(data)
+        return data
+
+    def close(self):
+        """docstring for close"""
+        self._f.close()
+
+
 def install_plugin_from_git(dut, url, branch, script,
                             waiting=5, timeout=180, commitid=None):
     """
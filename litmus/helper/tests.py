@@ -13,15 +13,23 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import os
 import re
 import sys
 import time
 import queue
 import logging
 import subprocess
-from threading import Thread
+from threading import Thread, Lock
 from litmus.core.util import convert_single_item_to_list
+from litmus.core.util import find_pattern
+from litmus.core.util import popen
+from litmus.core.resultwriter import resultwriter
+
+_path_boot_id = '/proc/sys/kernel/random/boot_id'
+_pattern_dmesg_timestamp = r'(?m)^\[\s*([0-9]+\.[0-9]+)\]'
+_dmesg_cursors = {}
+_dmesg_locks = {}
+_dmesg_lock = Lock()
 
 
 def add_test_helper(dut, testcases):
@@ -53,6 +61,7 @@ def add_test_helper(dut, testcases):
               - name: verify_dmesg
                 from: litmus.helper.tests
                 result_dir: result
+                timeout: 60
                 plan:
                   - name: panel_is_alive
                     param: panel
@@ -63,17 +72,82 @@ def add_test_helper(dut, testcases):
     for loop in testcases['testcases']:
         fromstr = loop['from']
         name = loop['name']
+        shareable = loop.pop('shareable', None)
+        timeout = loop.pop('timeout', None)
         del loop['from']
         del loop['name']
         __import__(fromstr)
-        dut.add_test(getattr(sys.modules[fromstr], name), loop)
+        dut.add_test(getattr(sys.modules[fromstr], name), loop,
+                     shareable=shareable, timeout=timeout)
+
+
+def shareable(func):
+    """
+    Mark a test function as shareable.
+    Shareable tests run concurrently with each other in run_tests.
+
+    Example:
+        >>> from litmus.helper.tests import shareable
+        >>> @shareable
+            def verify_something(dut, result_dir):
+                dut.run_cmd('ls')
+        >>> dut.add_test(verify_something, {'result_dir': 'result'})
+        >>> dut.run_tests(parallel=4)
+
+    :param func func: test function
+
+    :returns func: test function
+    """
+    func.shareable = True
+    return func
+
+
+def _bre_to_re(pattern):
+    """docstring for _bre_to_re"""
+    # param was a grep basic regular expression. ( ) { } + ? | are literal
+    # unless they are escaped and \< \> are word boundaries.
+    out = ''
+    escaped = False
+    for c in pattern:
+        if escaped:
+            out += c if c in '(){}+?|' else \
+                r'\b' if c in '<>' else '\\' + c
+            escaped = False
+        elif c == '\\':
+            escaped = True
+        else:
+            out += '\\' + c if c in '(){}+?|' else c
+    return out + ('\\\\' if escaped else '')
+
+
+def _match_plan(plan, data):
+    """docstring for _match_plan"""
+    # lines are scanned once. an item is dropped once it is matched.
+    # a line matches if it matches param as grep does and pattern.
+    pending = [(idx, re.compile(_bre_to_re(item['param'])),
+                re.compile(item['pattern']))
+               for idx, item in enumerate(plan)]
+    matched = [False] * len(plan)
+    for line in data.splitlines():
+        if not pending:
+            break
+        remaining = []
+        for l in pending:
+            if l[1].search(line) and l[2].search(line):
+                matched[l[0]] = True
+            else:
+                remaining.append(l)
+        pending = remaining
+    return matched
 
 
 # pre-defined tests
+@shareable
 def verify_process_is_running(dut, plan, result_dir):
     """
     Check whether mandatory processes are running or not.
-    This testcase runs \'ps\' and \'grep\' commands on device.
+    This testcase takes one \'ps\' snapshot on device and checks all
+    items of plan against it.
 
     :param device dut: device instance
     :param dict plan: test plan
@@ -93,54 +167,27 @@ def verify_process_is_running(dut, plan, result_dir):
 
     """
     test_name = 'verify_process_is_running'
-    template_report = """<report categ='SmokeTest' failures='{failure_cnt}' name='{test_name}'>
-{data}</report>"""
-    template_test = """    <test executed='yes' name='{tc_name}'>
-        <result>
-            <success passed='{tc_result}' state='{tc_state}' />
-        </result>
-    </test>
-"""
-
-    def _verify(item):
-        """docstring for _verify"""
-        cmd = ['ps', 'ax', '|', 'grep', item['param']]
-        res = dut.run_cmd(cmd)
-        p = re.compile(item['pattern'])
-        if p.search(res):
-            return True
-        else:
-            return False
 
-    def _run():
-        results = ''
-        failure_cnt = 0
-        for item in plan:
-            tc_result = 'yes' if _verify(item) else 'no'
-            failure_cnt = failure_cnt+1 if tc_result != 'yes' else failure_cnt
-            dict_for_output = {'tc_name': item['name'],
-                               'tc_result': tc_result,
-                               'tc_state': 100 if tc_result == 'yes' else 0}
-            results += template_test.format(**dict_for_output)
-        output = template_report.format(failure_cnt=failure_cnt,
-                                        test_name=test_name,
-                                        data=results)
-        logging.debug(output)
-        return output
-
-    def _save_result(result, result_dir):
-        """docstring for _save_result"""
-        with open(os.path.join(result_dir,
-                               'testresult_process_is_running.xml'), 'w') as f:
-            f.write(result)
-
-    _save_result(_run(), os.path.abspath(result_dir))
+    with resultwriter(result_dir, 'testresult_process_is_running',
+                      test_name) as writer:
+        # ps cuts lines to the terminal width of sdb shell unless piped
+        matched = _match_plan(plan,
+                              dut.run_cmd(['ps', 'ax', '|', 'cat']) or '')
+        for item, found in zip(plan, matched):
+            writer.add(item['name'], found,
+                       message=None if found else
+                       '{} is not running'.format(item['param']))
+        logging.debug('{0} : {1} failures in {2} tests'
+                      .format(test_name, writer.failures, writer.tests))
 
 
+@shareable
 def verify_dmesg(dut, plan, result_dir):
     """
     Read kernel logs and check whether error log exists or not.
-    This testcase runs \'dmesg\' and \'grep\' commands on device.
+    This testcase runs \'dmesg\' command on device once and checks all
+    items of plan against it. In the same boot, only kernel logs after the
+    previous check are read and items found before stay failed.
 
     :param device dut: device instance
     :param dict plan: test plan
@@ -157,49 +204,55 @@ def verify_dmesg(dut, plan, result_dir):
 
     """
     test_name = 'verify_dmesg'
-    template_report = """<report categ='SmokeTest' failures='{failure_cnt}' name='{test_name}'>
-{data}</report>"""
-    template_test = """    <test executed='yes' name='{tc_name}'>
-        <result>
-            <success passed='{tc_result}' state='{tc_state}' />
-        </result>
-    </test>
-"""
-
-    def _verify(item):
-        """docstring for _verify"""
-        cmd = ['dmesg', '|', 'grep', item['param']]
-        res = dut.run_cmd(cmd)
-        p = re.compile(item['pattern'])
-        if not p.search(res):
-            return True
-        else:
-            return False
 
-    def _run():
-        results = ''
-        failure_cnt = 0
+    def _read_dmesg():
+        """docstring for _read_dmesg"""
+        cursor = _dmesg_cursors.get(dut.get_name())
+        if cursor and cursor['timestamp']:
+            p = '^\\[ *{}\\]'.format(cursor['timestamp'].replace('.', '\\.'))
+            cmd = ('cat {0}; d=$(dmesg); echo "$d" | grep -q \'{1}\' && '
+                   'echo "$d" | sed -n \'/{1}/,$p\' || echo "$d"'
+                   .format(_path_boot_id, p))
+        else:
+            cmd = 'cat {0}; dmesg'.format(_path_boot_id)
+        boot_id, _, data = (dut.run_cmd(cmd, timeout=60) or '').partition('\n')
+        boot_id = boot_id.strip()
+
+        if not cursor or cursor['boot_id'] != boot_id:
+            cursor = {'boot_id': boot_id, 'timestamp': None, 'found': set()}
+
+        # the last timestamp is the cursor of the next check
+        for line in reversed(data.splitlines()):
+            timestamp = find_pattern(_pattern_dmesg_timestamp, line,
+                                     groupindex=1)
+            if timestamp:
+                cursor['timestamp'] = timestamp
+                break
+        _dmesg_cursors[dut.get_name()] = cursor
+        return cursor, data
+
+    # checks of the same device share its cursor. other devices go on.
+    with _dmesg_lock:
+        lock = _dmesg_locks.setdefault(dut.get_name(), Lock())
+
+    with resultwriter(result_dir, 'testresult_dmesg', test_name) as writer:
+        with lock:
+            cursor, data = _read_dmesg()
+            matched = _match_plan(plan, data)
+            for item, found in zip(plan, matched):
+                if found:
+                    cursor['found'].add((item['param'], item['pattern']))
+            found = set(cursor['found'])
         for item in plan:
-            tc_result = 'yes' if _verify(item) else 'no'
-            failure_cnt = failure_cnt+1 if tc_result != 'yes' else failure_cnt
-            dict_for_output = {'tc_name': item['name'],
-                               'tc_result': tc_result,
-                               'tc_state': 100 if tc_result == 'yes' else 0}
-            results += template_test.format(**dict_for_output)
-        output = template_report.format(failure_cnt=failure_cnt,
-                                        test_name=test_name,
-                                        data=results)
-        logging.debug(output)
-        return output
-
-    def _save_result(result, result_dir):
-        """docstring for _save_result"""
-        with open(os.path.join(result_dir, 'testresult_dmesg.xml'), 'w') as f:
-            f.write(result)
-
-    _save_result(_run(), os.path.abspath(result_dir))
+            passed = (item['param'], item['pattern']) not in found
+            writer.add(item['name'], passed,
+                       message=None if passed else
+                       '{} is found in dmesg'.format(item['pattern']))
+        logging.debug('{0} : {1} failures in {2} tests'
+                      .format(test_name, writer.failures, writer.tests))
 
 
+@shareable
 def verify_wifi_is_working(dut, wifi_apname, wifi_password, result_dir):
     """
     Try to connect wifi ap and publish the test result as a xml file.
@@ -216,130 +269,138 @@ def verify_wifi_is_working(dut, wifi_apname, wifi_password, result_dir):
 
     """
     test_name = 'wifi_is_working'
-    template_report = """<report categ='SmokeTest' failures='{failure_cnt}' name='{test_name}'>
-{data}</report>"""
-    template_test = """    <test executed='yes' name='{tc_name}'>
-        <result>
-            <success passed='{tc_result}' state='{tc_state}' />
-        </result>
-    </test>
-"""
+
+    fail_deactivated = ['Wi-Fi Activation Failed! error : OPERATION_FAILED',
+                        'Device state changed callback, state : Deactivated',
+                        'Operation failed!']
+    # each step writes cmd and advances as soon as a line in 'pass' is
+    # read. a step is retried up to 'retry' times on failure, and a step
+    # with 'until' is repeated until a line contains it.
+    steps = [
+        {'name': 'start', 'cmd': 'wifi_test; exit',
+         'pass': ['Test Thread created...']},
+        {'name': 'init', 'cmd': '1',
+         'pass': ['Operation succeeded!'],
+         'fail': ['Operation failed!']},
+        {'name': 'activate', 'cmd': '3',
+         'pass': ['Success to activate Wi-Fi device',
+                  'Wi-Fi Activation Succeeded',
+                  'Fail to activate Wi-Fi device [ALREADY_EXISTS]'],
+         'timeout': 20},
+        {'name': 'scan', 'cmd': '9',
+         'pass': ['Operation succeeded!'],
+         'fail': ['Operation failed!'],
+         'retry': 8, 'interval': 1},
+        {'name': 'get_ap_list', 'cmd': 'b',
+         'pass': ['Get AP list finished'],
+         'until': wifi_apname, 'retry': 10, 'interval': 1},
+        {'name': 'select_ap', 'cmd': 'c',
+         'pass': ['Input a part of AP name to connect :'],
+         'fail': fail_deactivated},
+        {'name': 'ap_name', 'cmd': wifi_apname,
+         'pass': ['Passphrase required : TRUE',
+                  'Passphrase required : FALSE'],
+         'fail': fail_deactivated},
+        {'name': 'passphrase', 'cmd': wifi_password,
+         'pass': ['Connection step finished'],
+         'fail': fail_deactivated,
+         'skip': not wifi_password},
+        {'name': 'connection_state', 'cmd': '6',
+         'pass': ['Success to get connection state : Connected',
+                  'Wi-Fi Connection Succeeded'],
+         'fail': fail_deactivated +
+         ['Wi-Fi Connection Failed! error : INVALID_KEY',
+          'Success to get connection state : Disconnected',
+          'Connection state changed callback, state : '
+          'Disconnected, AP name : {}'.format(wifi_apname)]},
+        {'name': 'exit', 'cmd': '0',
+         'pass': ['exit']},
+        ]
 
     def _enqueue_output(out, queue):
         for line in iter(out.readline, b''):
             queue.put(line.strip().decode())
         out.close()
 
-    def _write_cmd(cmd, status_pass, status_fail, timeout=10):
+    def _write_cmd(cmd):
         """docstring for _write_cmd"""
-        status_pass = convert_single_item_to_list(status_pass)
-        status_fail = convert_single_item_to_list(status_fail)
-
         logging.debug('===== cmd : {} ====='.format(cmd))
-        cmd = cmd + '\r'
-        start_time = time.perf_counter()
-        sdbshell.stdin.write(cmd.encode())
+        sdbshell.stdin.write((cmd + '\r').encode())
         sdbshell.stdin.flush()
-        time.sleep(0.5)
+
+    def _expect(step, timeout):
+        """docstring for _expect"""
+        status_pass = convert_single_item_to_list(step['pass'])
+        status_fail = convert_single_item_to_list(step.get('fail'))
+        until = step.get('until')
+        seen = not until
+        start_time = time.perf_counter()
+        nudged = False
         logging.debug('response:')
         while True:
+            elapsed = time.perf_counter() - start_time
+            if elapsed > timeout:
+                raise Exception('timeout : {}'.format(step['name']))
+            if not nudged and elapsed > timeout / 2:
+                # wifi_test may wait for a key to show the menu again
+                sdbshell.stdin.write('\r'.encode())
+                sdbshell.stdin.flush()
+                nudged = True
+            deadline = timeout if nudged else timeout / 2
             try:
-                line = q.get(timeout=0.1)
-                logging.debug(line)
+                line = q.get(timeout=deadline - elapsed)
             except queue.Empty:
-                wait_time = time.perf_counter() - start_time
-                if wait_time > timeout:
-                    raise Exception('timeout')
-                elif wait_time > (timeout / 2):
-                    sdbshell.stdin.write('\r'.encode())
-                    sdbshell.stdin.flush()
-                    time.sleep(1)
-            else:
-                if line in status_pass:
-                    break
-                elif line in status_fail:
-                    raise Exception('wifi test return fail : {}'.format(line))
-
-    def _run():
+                continue
+            logging.debug(line)
+            if until and until in line:
+                seen = True
+            if line in status_pass:
+                return seen
+            elif line in status_fail:
+                raise Exception('wifi test return fail : {}'.format(line))
+
+    def _run_step(step):
+        """docstring for _run_step"""
+        start_time = time.perf_counter()
+        error = None
+        for loop in range(step.get('retry', 1)):
+            _write_cmd(step['cmd'])
+            try:
+                if _expect(step, step.get('timeout', 10)):
+                    return time.perf_counter() - start_time
+                error = Exception('{0} is not found : {1}'
+                                  .format(step['until'], step['name']))
+            except Exception as e:
+                error = e
+            logging.debug(error)
+            time.sleep(step.get('interval', 0))
+        raise error
+
+    def _run(writer):
         """docstring for _run"""
-
+        timings = []
         try:
-            _write_cmd('wifi_test; exit', 'Test Thread created...', None)
-            _write_cmd('1', 'Operation succeeded!', 'Operation failed!')
-            _write_cmd('3',
-                       ['Success to activate Wi-Fi device',
-                        'Wi-Fi Activation Succeeded',
-                        'Fail to activate Wi-Fi device [ALREADY_EXISTS]'],
-                       None)
-            time.sleep(7)
-            _write_cmd('9', 'Operation succeeded!', 'Operation failed!')
-            time.sleep(3)
-            for loop in range(3):
-                _write_cmd('b', 'Get AP list finished', None)
-                time.sleep(3)
-            _write_cmd('c',
-                       'Input a part of AP name to connect :',
-                       ['Wi-Fi Activation Failed! error : OPERATION_FAILED',
-                        'Device state changed callback, state : Deactivated',
-                        'Operation failed!'])
-            _write_cmd(wifi_apname,
-                       ['Passphrase required : TRUE',
-                        'Passphrase required : FALSE'],
-                       ['Wi-Fi Activation Failed! error : OPERATION_FAILED',
-                        'Device state changed callback, state : Deactivated',
-                        'Operation failed!'])
-            if wifi_password and wifi_password != '':
-                _write_cmd(wifi_password,
-                           'Connection step finished',
-                           ['Wi-Fi Activation Failed! error : '
-                            'OPERATION_FAILED',
-                            'Device state changed callback, state : '
-                            'Deactivated',
-                            'Operation failed!'])
-            _write_cmd('6',
-                       ['Success to get connection state : Connected',
-                        'Wi-Fi Connection Succeeded'],
-                       ['Wi-Fi Activation Failed! error : OPERATION_FAILED',
-                        'Wi-Fi Connection Failed! error : INVALID_KEY',
-                        'Device state changed callback, state : Deactivated',
-                        'Operation failed!',
-                        'Success to get connection state : Disconnected',
-                        'Connection state changed callback, state : '
-                        'Disconnected, AP name : {}'.format(wifi_apname)])
-            _write_cmd('0', 'exit', None)
-
-            dict_for_output = {'tc_name': test_name,
-                               'tc_result': 'yes',
-                               'tc_state': 100}
-            results = template_test.format(**dict_for_output)
-            output = template_report.format(failure_cnt=0,
-                                            test_name=test_name,
-                                            data=results)
-        except Exception:
-            dict_for_output = {'tc_name': test_name,
-                               'tc_result': 'no',
-                               'tc_state': 0}
-            results = template_test.format(**dict_for_output)
-            output = template_report.format(failure_cnt=1,
-                                            test_name=test_name,
-                                            data=results)
+            for step in steps:
+                if step.get('skip'):
+                    continue
+                timings.append((step['name'], _run_step(step)))
+            writer.add(test_name, True)
+        except Exception as e:
+            logging.debug(e)
+            writer.add(test_name, False, message=str(e))
         finally:
+            logging.debug('wifi steps : {}'.format(
+                ', '.join('{0} {1:.2f}s'.format(*l) for l in timings)))
             sdbshell.terminate()
-            return output
-
-    def _save_result(result, result_dir):
-        """docstring for _save_result"""
-        logging.debug(result)
-        with open(os.path.join(result_dir, 'testresult_wifi.xml'), 'w') as f:
-            f.write(result)
 
-    sdbshell = subprocess.Popen(['sdb', '-s', dut.get_id(), 'shell'],
-                                stdin=subprocess.PIPE,
-                                stdout=subprocess.PIPE,
-                                stderr=subprocess.PIPE)
+    sdbshell = popen(['sdb', '-s', dut.get_id(), 'shell'],
+                     stdin=subprocess.PIPE,
+                     stdout=subprocess.PIPE,
+                     stderr=subprocess.PIPE)
 
     q = queue.Queue()
     t = Thread(target=_enqueue_output, args=(sdbshell.stdout, q))
     t.daemon = True
     t.start()
-    _save_result(_run(), os.path.abspath(result_dir))
+    with resultwriter(result_dir, 'testresult_wifi', test_name) as writer:
+        _run(writer)
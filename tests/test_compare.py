@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+import unittest
+from PIL import Image, ImageDraw
+from litmus.helper.compare import dhash, hamming_distance, ssim
+from litmus.helper.compare import diff_ratio, compare_images
+
+
+def _screen(size=(64, 48), box=(8, 8, 40, 32), color=(255, 255, 255)):
+    """Dark screen with a bright box"""
+    image = Image.new('RGB', size, (20, 30, 40))
+    ImageDraw.Draw(image).rectangle(box, fill=color)
+    return image
+
+
+class TestCompare(unittest.TestCase):
+
+    def test_identical(self):
+        result = compare_images(_screen(), _screen())
+
+        self.assertTrue(result['same'])
+        self.assertEqual(first=result['ssim'], second=1.0)
+        self.assertEqual(first=result['diff_ratio'], second=0.0)
+
+    def test_different(self):
+        image = _screen(box=(30, 20, 60, 44), color=(200, 0, 0))
+        result = compare_images(image, _screen())
+
+        self.assertFalse(result['same'])
+        self.assertGreater(hamming_distance(dhash(image), dhash(_screen())),
+                           0)
+
+    def test_size_mismatch(self):
+        result = compare_images(_screen(size=(32, 32)), _screen())
+
+        self.assertFalse(result['same'])
+        self.assertEqual(first=result['distance'], second=None)
+
+    def test_masked_box(self):
+        # only the clock area differs
+        image = _screen()
+        ImageDraw.Draw(image).rectangle((50, 0, 63, 6), fill=(255, 0, 0))
+
+        self.assertFalse(compare_images(image, _screen(),
+                                        max_distance=64)['same'])
+        self.assertTrue(compare_images(image, _screen(),
+                                       mask=[(50, 0, 64, 7)])['same'])
+        self.assertEqual(first=diff_ratio(image, _screen(),
+                                          mask=[(50, 0, 64, 7)]),
+                         second=0.0)
+
+    def test_mask_image(self):
+        image = _screen()
+        ImageDraw.Draw(image).rectangle((0, 40, 63, 47), fill=(0, 0, 255))
+        mask = Image.new('L', image.size, 255)
+        ImageDraw.Draw(mask).rectangle((0, 40, 63, 47), fill=0)
+
+        self.assertEqual(first=ssim(image, _screen(), mask=mask),
+                         second=1.0)
+
+    def test_diff_ratio_tolerance(self):
+        image = Image.new('RGB', (10, 10), (100, 100, 100))
+        reference = Image.new('RGB', (10, 10), (110, 100, 100))
+
+        self.assertEqual(first=diff_ratio(image, reference), second=0.0)
+        self.assertEqual(first=diff_ratio(image, reference, tolerance=5),
+                         second=1.0)
+
+    def test_smaller_than_window(self):
+        image = Image.new('RGB', (4, 4), (10, 20, 30))
+        other = Image.new('RGB', (4, 4), (200, 0, 0))
+
+        self.assertEqual(first=ssim(image, image.copy()), second=1.0)
+        self.assertLess(ssim(image, other), 1.0)
+        self.assertTrue(compare_images(image, image.copy())['same'])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+
+import re
+import socket
+import threading
+import unittest
+import http.server
+import socketserver
+from litmus.device.cutterpdu import cutterpdu
+
+
+class _pdu(object):
+    """Outlet states shared by the stand-in servers"""
+
+    def __init__(self, outlets=8):
+        self.outlets = {i: 'off' for i in range(1, outlets + 1)}
+        self.requests = 0
+
+    def status(self, fmt='outlet {0} : {1}'):
+        return '\n'.join(fmt.format(k, v) for k, v in self.outlets.items())
+
+
+class _http_handler(http.server.BaseHTTPRequestHandler):
+    """HTTP stand-in which speaks both default and vendor style commands"""
+
+    protocol_version = 'HTTP/1.1'
+    pdu = None
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, body):
+        data = body.encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self.pdu.requests += 1
+        m = re.match(r'/outlet\?(\d+)=(on|off)$', self.path)
+        if m:
+            self.pdu.outlets[int(m.group(1))] = m.group(2)
+            return self._reply('ok')
+        if self.path == '/status':
+            return self._reply(self.pdu.status())
+        if self.path == '/api/outlets':
+            return self._reply(self.pdu.status('<o id="{0}" s="{1}"/>')
+                               .replace('"on"', '"1"')
+                               .replace('"off"', '"0"'))
+        self.send_error(404)
+
+    def do_POST(self):
+        self.pdu.requests += 1
+        m = re.match(r'/api/outlet/(\d+)/([01])$', self.path)
+        if not m:
+            return self.send_error(404)
+        self.pdu.outlets[int(m.group(1))] = 'on' if m.group(2) == '1' \
+            else 'off'
+        self._reply('ok')
+
+
+class _telnet_handler(socketserver.StreamRequestHandler):
+    """Telnet stand-in with login and option negotiation"""
+
+    pdu = None
+
+    def handle(self):
+        self.wfile.write(b'\xff\xfb\x01User: ')
+        self.rfile.readline()
+        self.wfile.write(b'Password: ')
+        if self.rfile.readline().strip() != b'secret':
+            return
+        self.wfile.write(b'> ')
+        for line in self.rfile:
+            command = line.decode().strip()
+            self.pdu.requests += 1
+            m = re.match(r'outlet (\d+) (on|off)$', command)
+            if m:
+                self.pdu.outlets[int(m.group(1))] = m.group(2)
+                out = 'ok'
+            elif command == 'status':
+                out = self.pdu.status()
+            else:
+                out = 'unknown command'
+            self.wfile.write('{0}\r\n{1}\r\n> '.format(command, out)
+                             .encode())
+
+
+class TestCutterPdu(unittest.TestCase):
+
+    def _serve(self, server_cls, handler):
+        server = server_cls(('127.0.0.1', 0), handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server.server_address[1]
+
+    def _cutters(self, port, scheme, count, **kwargs):
+        return [cutterpdu(cutter_type='pdu',
+                          cutter_port='{0}://127.0.0.1:{1}'.format(scheme,
+                                                                   port),
+                          pdu_outlet=str(i), **kwargs)
+                for i in range(1, count + 1)]
+
+    def setUp(self):
+        self.pdu = _pdu()
+        _http_handler.pdu = self.pdu
+        _telnet_handler.pdu = self.pdu
+
+    def test_http(self):
+        port = self._serve(http.server.ThreadingHTTPServer, _http_handler)
+        cutters = self._cutters(port, 'http', 4)
+
+        self.assertTrue(cutterpdu.set_switch(cutters, True))
+        self.assertEqual(first=[c.is_on() for c in cutters],
+                         second=[True] * 4)
+        self.assertTrue(cutterpdu.set_switch(cutters[:2], False))
+        self.assertEqual(first=[c.is_on() for c in cutters],
+                         second=[False, False, True, True])
+
+    def test_http_vendor_commands(self):
+        port = self._serve(http.server.ThreadingHTTPServer, _http_handler)
+        cutters = self._cutters(port, 'http', 2,
+                                pdu_setcmd='/api/outlet/{outlet}/{state}',
+                                pdu_getcmd='/api/outlets',
+                                pdu_pattern=r'id="{outlet}" s="([01])"',
+                                pdu_state_on='1',
+                                pdu_state_off='0',
+                                pdu_method='post')
+
+        self.assertTrue(cutterpdu.set_switch(cutters[1:], True))
+        self.assertEqual(first=[c.is_on() for c in cutters],
+                         second=[False, True])
+
+    def test_telnet(self):
+        port = self._serve(socketserver.ThreadingTCPServer, _telnet_handler)
+        cutters = self._cutters(port, 'telnet', 3,
+                                pdu_username='admin', pdu_password='secret')
+
+        self.assertTrue(cutterpdu.set_switch(cutters, True))
+        self.assertEqual(first=[c.is_on() for c in cutters],
+                         second=[True] * 3)
+        cutters[0]._set_outlet(False)
+        self.assertFalse(cutters[0].is_on())
+
+    def test_unreachable(self):
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        cutter = self._cutters(port, 'http', 1)[0]
+
+        self.assertFalse(cutter._set_outlet(True))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
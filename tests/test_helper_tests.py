@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+
+import re
+import unittest
+from litmus.helper.tests import _bre_to_re, _match_plan
+
+
+class TestHelperTests(unittest.TestCase):
+
+    def _grep(self, param, line):
+        return bool(re.search(_bre_to_re(param), line))
+
+    def test_bre_to_re(self):
+        self.assertEqual(first=_bre_to_re('dbus'), second='dbus')
+        self.assertEqual(first=_bre_to_re('a.b*'), second='a.b*')
+        self.assertEqual(first=_bre_to_re('x(1)'), second=r'x\(1\)')
+        self.assertEqual(first=_bre_to_re(r'a\(b\)'), second='a(b)')
+        self.assertEqual(first=_bre_to_re('c++'), second=r'c\+\+')
+        self.assertEqual(first=_bre_to_re(r'\<word\>'), second=r'\bword\b')
+
+    def test_grep_semantics(self):
+        self.assertTrue(self._grep('dbus-daemon', '/usr/bin/dbus-daemon'))
+        self.assertTrue(self._grep('^ *1 ', '  1 ?  S  0:00 init'))
+        self.assertTrue(self._grep('a|b', 'x a|b y'))
+        self.assertFalse(self._grep('a|b', 'a'))
+        self.assertTrue(self._grep(r'a\|b', 'b'))
+        self.assertTrue(self._grep('foo(bar)', 'foo(bar)'))
+        self.assertFalse(self._grep(r'\<bus\>', 'dbus'))
+        self.assertTrue(self._grep('[0-9]\\{3\\}', 'pid 123'))
+
+    def test_match_plan(self):
+        data = ('  1 ?  S  0:00 /sbin/init\n'
+                ' 99 ?  S  0:00 /usr/bin/dbus-daemon --system '
+                '--address=systemd: --nofork --nopidfile '
+                '--systemd-activation --syslog-only\n')
+        plan = [{'param': 'dbus', 'pattern': '.*--syslog-only.*'},
+                {'param': 'init', 'pattern': '.*dbus.*'},
+                {'param': 'deviced', 'pattern': '.*'}]
+
+        self.assertEqual(first=_match_plan(plan, data),
+                         second=[True, False, False])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
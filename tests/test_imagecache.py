@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+from litmus.core.imagecache import imagecache
+
+
+def _archive(path, images):
+    """Write a tar.gz archive of images"""
+    with tarfile.open(path, 'w:gz') as tar:
+        for name, data in sorted(images.items()):
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+
+
+class TestImageCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cachedir = os.path.join(self.tmpdir, 'cache')
+        self.dest = os.path.join(self.tmpdir, 'dest')
+        os.makedirs(self.dest)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _path(self, name):
+        return os.path.join(self.tmpdir, name)
+
+    def _entries(self):
+        return sorted(l for l in os.listdir(self.cachedir)
+                      if not l.startswith('.'))
+
+    def test_miss_and_hit(self):
+        _archive(self._path('a.tar.gz'), {'zImage': b'kernel',
+                                          'rootfs.img': b'rootfs'})
+        cache = imagecache(cachedir=self.cachedir)
+
+        images = cache.extract(self._path('a.tar.gz'), self.dest)
+        self.assertEqual(first=images, second=['rootfs.img', 'zImage'])
+        self.assertEqual(first=len(self._entries()), second=1)
+        with open(os.path.join(self.dest, 'zImage'), 'rb') as f:
+            self.assertEqual(first=f.read(), second=b'kernel')
+
+        # a copy of the archive hits the same entry
+        shutil.copy(self._path('a.tar.gz'), self._path('b.tar.gz'))
+        entry = os.path.join(self.cachedir, self._entries()[0])
+        mtime = os.stat(os.path.join(entry, 'zImage')).st_mtime
+        images = cache.extract([self._path('b.tar.gz')], self.dest)
+        self.assertEqual(first=images, second=['rootfs.img', 'zImage'])
+        self.assertEqual(first=len(self._entries()), second=1)
+        self.assertEqual(first=os.stat(os.path.join(entry,
+                                                    'zImage')).st_mtime,
+                         second=mtime)
+
+    def test_no_temporary_directory_is_left(self):
+        _archive(self._path('a.tar.gz'), {'zImage': b'kernel'})
+        imagecache(cachedir=self.cachedir).extract(self._path('a.tar.gz'),
+                                                   self.dest)
+
+        self.assertFalse([l for l in os.listdir(self.cachedir)
+                          if l.endswith('.tmp')])
+
+    def test_evict_least_recently_used(self):
+        cache = imagecache(cachedir=self.cachedir, max_size=1024 * 1024)
+        for name in ('old', 'new'):
+            _archive(self._path(name), {name + '.img': os.urandom(700000)})
+        cache.extract(self._path('old'), self.dest)
+        old_entry = self._entries()[0]
+        os.utime(os.path.join(self.cachedir, old_entry), (0, 0))
+
+        cache.extract(self._path('new'), self.dest)
+
+        self.assertEqual(first=len(self._entries()), second=1)
+        self.assertNotEqual(first=self._entries()[0], second=old_entry)
+        # images linked before eviction stay usable
+        self.assertTrue(os.path.exists(os.path.join(self.dest, 'old.img')))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import time
+import tempfile
+import unittest
+from array import array
+from litmus.core.powersampler import powersampler
+
+
+def _sampler(powers, marks):
+    """Sampler with a fixed series, one sample per second"""
+    sampler = powersampler(lambda: None)
+    sampler.timestamps = array('d', range(len(powers)))
+    sampler.voltages = array('d', [5.0] * len(powers))
+    sampler.currents = array('d', [p / 5.0 for p in powers])
+    sampler.powers = array('d', powers)
+    sampler.marks = marks
+    return sampler
+
+
+class TestPowerSampler(unittest.TestCase):
+
+    def test_total(self):
+        total = _sampler([1.0, 3.0, 3.0, 1.0], []).summary()['total']
+
+        self.assertEqual(first=total['samples'], second=4)
+        self.assertEqual(first=total['duration'], second=3.0)
+        self.assertEqual(first=total['mean_power'], second=2.0)
+        self.assertEqual(first=total['peak_power'], second=3.0)
+        # trapezoids : 2 + 3 + 2
+        self.assertEqual(first=total['energy'], second=7.0)
+
+    def test_empty(self):
+        total = _sampler([], []).summary()['total']
+
+        self.assertEqual(first=(total['samples'], total['energy']),
+                         second=(0, 0.0))
+
+    def test_overlapping_segments_of_same_label(self):
+        marks = [(0.0, 'verify_dmesg', True, 0),
+                 (1.0, 'verify_dmesg', True, 1),
+                 (2.0, 'verify_dmesg', False, 0),
+                 (4.0, 'verify_dmesg', False, 1)]
+        sampler = _sampler([1.0, 2.0, 3.0, 4.0, 5.0], marks)
+
+        segments = sampler.summary()['segments']
+        self.assertEqual(first=[(l['label'], l['duration'])
+                                for l in segments],
+                         second=[('verify_dmesg', 2.0),
+                                 ('verify_dmesg', 3.0)])
+        self.assertEqual(first=sampler.segment(1)['peak_power'], second=5.0)
+        self.assertEqual(first=sampler.segment(0)['mean_power'], second=2.0)
+        self.assertEqual(first=sampler.segment(2), second=None)
+
+    def test_end_mark_without_key(self):
+        marks = [(0.0, 'a', True, 0), (1.0, 'a', False, None)]
+        segments = _sampler([1.0, 1.0, 1.0], marks).summary()['segments']
+
+        self.assertEqual(first=[l['samples'] for l in segments], second=[2])
+
+    def test_mark_and_sample(self):
+        values = iter([{'voltage': 5.0, 'current': 0.4, 'power': 2.0}] * 5)
+        sampler = powersampler(lambda: next(values, None), rate=100)
+        sampler.start()
+        key = sampler.mark('tc')
+        deadline = time.perf_counter() + 5
+        while len(sampler.powers) < 5 and time.perf_counter() < deadline:
+            time.sleep(0.01)
+        sampler.mark('tc', begin=False, key=key)
+        sampler.stop()
+
+        self.assertEqual(first=len(sampler.powers), second=5)
+        self.assertEqual(first=sampler.segment(key)['label'], second='tc')
+
+    def test_save(self):
+        fd, path = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        _sampler([1.0, 2.0], []).save(path)
+
+        with open(path) as f:
+            data = json.load(f)
+        self.assertEqual(first=data['samples']['power'], second=[1.0, 2.0])
+        self.assertEqual(first=data['total']['samples'], second=2)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
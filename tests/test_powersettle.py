@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+import os
+import shutil
+import tempfile
+import unittest
+from litmus.core.powersettle import powersettle
+
+
+class TestPowerSettle(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'powersettle.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_default_until_enough_samples(self):
+        settle = powersettle('XU3_001', self.path)
+        settle.record('off', 0.3)
+        settle.record('off', 0.3)
+
+        self.assertEqual(first=settle.get('off', 1), second=1)
+        settle.record('off', 0.4)
+        self.assertAlmostEqual(first=settle.get('off', 1), second=0.6)
+
+    def test_bounds(self):
+        settle = powersettle('XU3_001', self.path)
+        for loop in range(3):
+            settle.record('off', 0.01)
+        self.assertEqual(first=settle.get('off', 1), second=0.2)
+
+        settle.record('off', 2.0)
+        self.assertEqual(first=settle.get('off', 1), second=1)
+        self.assertEqual(first=settle.get('off', 1, maximum=4), second=3.0)
+        self.assertEqual(first=settle.get('off', 1, maximum=2), second=2)
+
+    def test_shared_between_instances(self):
+        for loop in range(3):
+            powersettle('XU3_001', self.path).record('off', 0.5)
+        powersettle('XU3_002', self.path).record('off', 3.0)
+
+        self.assertAlmostEqual(first=powersettle('XU3_001', self.path)
+                               .get('off', 1), second=0.75)
+        self.assertEqual(first=powersettle('XU3_002', self.path)
+                         .get('off', 1), second=1)
+
+    def test_reset(self):
+        settle = powersettle('XU3_001', self.path)
+        for loop in range(3):
+            settle.record('off', 0.5)
+        settle.reset('off')
+
+        self.assertEqual(first=settle.get('off', 1), second=1)
+        self.assertEqual(first=powersettle('XU3_001', self.path)
+                         .get('off', 1), second=1)
+
+    def test_max_samples(self):
+        settle = powersettle('XU3_001', self.path)
+        settle.record('off', 3.0)
+        for loop in range(20):
+            settle.record('off', 0.5)
+
+        self.assertAlmostEqual(first=settle.get('off', 4), second=0.75)
+
+    def test_broken_file(self):
+        with open(self.path, 'w') as f:
+            f.write('{broken')
+
+        self.assertEqual(first=powersettle('XU3_001', self.path)
+                         .get('off', 1), second=1)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
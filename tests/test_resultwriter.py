@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import time
+import shutil
+import tempfile
+import unittest
+import xml.etree.ElementTree as ET
+from litmus.core.resultwriter import resultwriter
+from litmus.device.device import device
+from litmus.helper.tests import verify_process_is_running
+
+
+class _dut(device):
+    """device without hardware which answers ps"""
+
+    def __init__(self):
+        self._name = 'DUT_001'
+        self._tests = None
+        self._powersampler = None
+
+    def __del__(self):
+        pass
+
+    def run_cmd(self, command, timeout=None):
+        # keep both runs of a batch open at the same time
+        time.sleep(0.2)
+        return ' 1 ?  S  0:00 /usr/bin/dbus-daemon --system\n'
+
+
+class TestResultWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.result_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.result_dir)
+
+    def _path(self, filename):
+        return os.path.join(self.result_dir, filename)
+
+    def _records(self, filename):
+        with open(self._path(filename)) as f:
+            return [json.loads(l) for l in f]
+
+    def test_add(self):
+        with resultwriter(self.result_dir, 'testresult', 'suite') as writer:
+            writer.add('first', True, duration=1.5)
+            writer.add('second', False, message='<broken> & "dead"')
+
+        root = ET.parse(self._path('testresult.xml')).getroot()
+        self.assertEqual(first=root.get('name'), second='suite')
+        self.assertEqual(first=[l.get('name') for l in root],
+                         second=['first', 'second'])
+        self.assertEqual(first=root[0].get('time'), second='1.500')
+        self.assertEqual(first=root[1][0].get('message'),
+                         second='<broken> & "dead"')
+        self.assertEqual(first=[l['passed'] for l in
+                                self._records('testresult.jsonl')],
+                         second=[True, False])
+        self.assertEqual(first=(writer.tests, writer.failures),
+                         second=(2, 1))
+
+    def test_properties(self):
+        with resultwriter(self.result_dir, 'testresult', 'suite') as writer:
+            writer.add('tc', False, message='timeout',
+                       properties={'mean_power': 2.1, 'energy': 4.2})
+
+        testcase = ET.parse(self._path('testresult.xml')).getroot()[0]
+        self.assertEqual(first=dict((l.get('name'), l.get('value'))
+                                    for l in testcase.find('properties')),
+                         second={'mean_power': '2.1', 'energy': '4.2'})
+        self.assertEqual(first=testcase.find('failure').get('message'),
+                         second='timeout')
+        self.assertEqual(first=self._records('testresult.jsonl')[0]
+                         ['properties'],
+                         second={'mean_power': 2.1, 'energy': 4.2})
+
+    def test_partial_result_is_well_formed(self):
+        writer = resultwriter(self.result_dir, 'testresult', 'suite')
+        try:
+            for idx in range(3):
+                writer.add('tc{}'.format(idx), True)
+                root = ET.parse(self._path('testresult.xml')).getroot()
+                self.assertEqual(first=len(root), second=idx + 1)
+        finally:
+            writer.close()
+
+    def test_same_name_in_parallel(self):
+        with resultwriter(self.result_dir, 'testresult', 'a') as first:
+            with resultwriter(self.result_dir, 'testresult', 'b') as second:
+                first.add('tc', True)
+                second.add('tc', False)
+
+        self.assertEqual(first=self._records('testresult.jsonl')[0]['suite'],
+                         second='a')
+        self.assertEqual(first=self._records('testresult_2.jsonl')[0]
+                         ['suite'], second='b')
+
+        # the name is free again after close
+        with resultwriter(self.result_dir, 'testresult', 'c') as writer:
+            self.assertEqual(first=writer.path,
+                             second=self._path('testresult'))
+
+    def test_duplicate_helpers_in_one_batch(self):
+        dut = _dut()
+        plan = [{'name': 'dbus_is_running', 'param': 'dbus',
+                 'pattern': '.*/usr/bin/dbus-daemon.*'}]
+        for loop in range(2):
+            dut.add_test(verify_process_is_running,
+                         {'plan': plan, 'result_dir': self.result_dir})
+
+        results = dut.run_tests(parallel=2)
+
+        self.assertEqual(first=[l['result'] for l in results],
+                         second=['passed', 'passed'])
+        for name in ('testresult_process_is_running',
+                     'testresult_process_is_running_2'):
+            root = ET.parse(self._path(name + '.xml')).getroot()
+            self.assertEqual(first=[l.get('name') for l in root],
+                             second=['dbus_is_running'])
+            self.assertEqual(first=len(self._records(name + '.jsonl')),
+                             second=1)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+import os
+import struct
+import tempfile
+import unittest
+from litmus.core import xwd
+
+
+def _xwd(width, height, bpp, pixels, byte_order=0, colors=(), version=7):
+    """Build a ZPixmap XWD file"""
+    name = b'screen\x00'
+    stride = width * bpp // 8
+    header = {'header_size': 100 + len(name), 'file_version': version,
+              'pixmap_format': 2, 'pixmap_depth': 24,
+              'pixmap_width': width, 'pixmap_height': height,
+              'xoffset': 0, 'byte_order': byte_order, 'bitmap_unit': 32,
+              'bitmap_bit_order': byte_order, 'bitmap_pad': 32,
+              'bits_per_pixel': bpp, 'bytes_per_line': stride,
+              'visual_class': 4 if bpp > 8 else 3,
+              'red_mask': 0xff0000, 'green_mask': 0xff00,
+              'blue_mask': 0xff, 'bits_per_rgb': 8,
+              'colormap_entries': len(colors), 'ncolors': len(colors),
+              'window_width': width, 'window_height': height,
+              'window_x': 0, 'window_y': 0, 'window_bdrwidth': 0}
+    data = struct.pack(xwd._header_format,
+                       *[header[l] for l in xwd._header_fields]) + name
+    for pixel, (r, g, b) in colors:
+        data += struct.pack(xwd._color_format, pixel,
+                            r << 8, g << 8, b << 8, 7, 0)
+    return data + pixels
+
+
+def _pixels(image):
+    """Return pixels in row-major order"""
+    return [image.getpixel((x, y)) for y in range(image.size[1])
+            for x in range(image.size[0])]
+
+
+class TestXwd(unittest.TestCase):
+
+    def test_truecolor_lsbfirst(self):
+        # BGRX bytes of red, green, blue and white pixels
+        pixels = bytes([0, 0, 255, 0, 0, 255, 0, 0,
+                        255, 0, 0, 0, 255, 255, 255, 0])
+        image = xwd.decode(_xwd(2, 2, 32, pixels))
+
+        self.assertEqual(first=image.size, second=(2, 2))
+        self.assertEqual(first=_pixels(image),
+                         second=[(255, 0, 0), (0, 255, 0),
+                                 (0, 0, 255), (255, 255, 255)])
+
+    def test_truecolor_msbfirst(self):
+        # XRGB bytes of red and blue pixels
+        pixels = bytes([0, 255, 0, 0, 0, 0, 0, 255])
+        image = xwd.decode(_xwd(2, 1, 32, pixels, byte_order=1))
+
+        self.assertEqual(first=_pixels(image),
+                         second=[(255, 0, 0), (0, 0, 255)])
+
+    def test_pseudocolor(self):
+        colors = [(0, (0, 0, 0)), (1, (10, 20, 30))]
+        image = xwd.decode(_xwd(3, 1, 8, bytes([1, 0, 1]), colors=colors))
+
+        self.assertEqual(first=_pixels(image),
+                         second=[(10, 20, 30), (0, 0, 0), (10, 20, 30)])
+
+    def test_load(self):
+        pixels = bytes([0, 0, 255, 0])
+        fd, path = tempfile.mkstemp(suffix='.xwd')
+        self.addCleanup(os.remove, path)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(_xwd(1, 1, 32, pixels))
+
+        self.assertEqual(first=xwd.load(path).getpixel((0, 0)),
+                         second=(255, 0, 0))
+
+    def test_unsupported(self):
+        with self.assertRaises(Exception):
+            xwd.decode(_xwd(1, 1, 32, bytes(4), version=6))
+        with self.assertRaises(Exception):
+            xwd.decode(_xwd(1, 1, 16, bytes(2)))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)